@@ -1,41 +1,38 @@
-import xml.etree.ElementTree as ET
 from ai_content_generator import AIContentGenerator
+from catalog_io import find_stage, read_table, stage_path
+from html_tables import extract_table_rows
+from product_classifier import classify_technical
+from cli_utils import confirm, get_api_key
+from feed_index import FeedIndex
+from feed_writer import write_patched_feed
+from request_metrics import request_context
+from result_journal import ResultJournal
+from profiling import stage
 import pandas as pd
+import json
 import os
 import re
+import sys
+from typing import Dict, List, Tuple
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
-def is_technical_product(name: str, category: str) -> bool:
-    """Определяет, является ли товар техническим (нуждается в tech поле)"""
-    technical_keywords = [
-        'станок', 'двигатель', 'мотор', 'привод', 'шпиндель', 'патрон',
-        'фреза', 'сверло', 'резец', 'диск', 'круг', 'полотно',
-        'насос', 'компрессор', 'генератор', 'трансформатор',
-        'редуктор', 'коробка', 'механизм', 'устройство',
-        'прибор', 'инструмент', 'оборудование', 'машина'
-    ]
-    
-    name_lower = name.lower()
-    category_lower = category.lower()
-    
-    # Проверяем ключевые слова в названии
-    for keyword in technical_keywords:
-        if keyword in name_lower:
-            return True
-    
-    # Проверяем категории
-    technical_categories = ['станки', 'оборудование', 'инструмент', 'механизм']
-    for cat_keyword in technical_categories:
-        if cat_keyword in category_lower:
-            return True
-    
-    return False
+# Журнал сгенерированных, но еще не записанных в XML правок
+PATCHES_PATH = 'feed-yml-0.patches.jsonl'
+
+# Лимит токенов ответа на одну таблицу tech и на весь пакетный ответ
+# (у моделей OpenRouter лимит ответа обычно около 8K токенов)
+TECH_MAX_TOKENS = 500
+TECH_BATCH_MAX_TOKENS = 8000
+
+# Сколько товаров одной категории генерировать одним запросом tech (1 - по одному);
+# больше TECH_BATCH_MAX_TOKENS // TECH_MAX_TOKENS таблиц в один ответ не помещается
+TECH_BATCH_SIZE = max(1, min(int(os.getenv('AI_TECH_BATCH', '1')), TECH_BATCH_MAX_TOKENS // TECH_MAX_TOKENS))
 
 def generate_tech_specs(ai_generator: AIContentGenerator, name: str, category: str) -> str:
-    """Генерирует технические характеристики для товара"""
+    """Генерирует технические характеристики для товара (через HTTP сессию генератора)"""
     prompt = f"""
     Создай технические характеристики для товара в виде HTML таблицы:
     Название: {name}
@@ -66,123 +63,233 @@ def generate_tech_specs(ai_generator: AIContentGenerator, name: str, category: s
     Верни только HTML таблицу без дополнительного текста.
     """
     
-    return ai_generator._make_request(prompt, max_tokens=500)
+    return ai_generator._make_request(prompt, max_tokens=TECH_MAX_TOKENS)
+
+def is_valid_tech_table(html: str) -> bool:
+    """Проверяет, что ответ - HTML таблица хотя бы с одной строкой параметр/значение"""
+    return bool(html) and '<table' in html and bool(extract_table_rows(html))
+
+def parse_tech_batch_response(response: str, vendor_codes: List[str]) -> Dict[str, str]:
+    """Разбирает JSON ответ пакетной генерации и оставляет только корректные таблицы"""
+    start = response.find('{')
+    end = response.rfind('}')
+    if start == -1 or end <= start:
+        return {}
+    
+    try:
+        data = json.loads(response[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    results = {}
+    for vendor_code in vendor_codes:
+        table = data.get(vendor_code)
+        if isinstance(table, str) and is_valid_tech_table(table):
+            results[vendor_code] = table.strip()
+    
+    return results
+
+def generate_tech_specs_batch(ai_generator: AIContentGenerator, products: List[Tuple[str, str]], category: str) -> Dict[str, str]:
+    """
+    Генерирует технические характеристики нескольких товаров одной категории одним запросом
+    
+    Args:
+        products: Пары (vendorCode, название)
+    
+    Returns:
+        Словарь vendorCode -> HTML таблица; товары, для которых таблицу не удалось
+        разобрать, генерируются отдельными запросами
+    """
+    product_lines = "\n".join(f"    - {vendor_code}: {name}" for vendor_code, name in products)
+    prompt = f"""
+    Создай технические характеристики для каждого товара в виде HTML таблицы.
+    Категория: {category}
+    Товары (vendorCode: название):
+{product_lines}
+    
+    Требования:
+    - Создай реалистичные технические характеристики
+    - Используй HTML таблицу с тегами <table>, <tbody>, <tr>, <td> без атрибутов
+    - Включи 8-15 основных параметров
+    - Параметры должны соответствовать типу оборудования, у моделей одной серии - согласованные значения
+    - Используй стандартные единицы измерения (мм, кВт, об/мин, В, кг и т.д.)
+    - На русском языке
+    
+    Верни JSON объект: ключ - vendorCode, значение - HTML таблица одной строкой, например
+    {{"{products[0][0]}": "<table><tbody><tr><td>Напряжение, В</td><td>380</td></tr></tbody></table>"}}
+    Верни только JSON без дополнительного текста.
+    """
+    
+    vendor_codes = [vendor_code for vendor_code, _ in products]
+    with request_context('tech_batch', ','.join(vendor_codes)):
+        response = ai_generator._make_request(prompt, max_tokens=min(TECH_MAX_TOKENS * len(products), TECH_BATCH_MAX_TOKENS))
+    results = parse_tech_batch_response(response, vendor_codes)
+    
+    # Товары без корректной таблицы генерируем по одному
+    for vendor_code, name in products:
+        if vendor_code not in results:
+            with request_context('tech', vendor_code):
+                results[vendor_code] = generate_tech_specs(ai_generator, name, category)
+    
+    return results
+
+def generate_tech_in_batches(ai_generator: AIContentGenerator, patches_journal: ResultJournal,
+                             product_data: Dict[str, Dict], vendor_codes: List[str]) -> int:
+    """Генерирует tech пакетами по TECH_BATCH_SIZE товаров одной категории, возвращает количество добавленных"""
+    by_category = {}
+    for vendor_code in vendor_codes:
+        by_category.setdefault(product_data[vendor_code]['category'], []).append(vendor_code)
+    
+    processed = 0
+    for category, codes in by_category.items():
+        for start in range(0, len(codes), TECH_BATCH_SIZE):
+            batch = [(vendor_code, product_data[vendor_code]['name']) for vendor_code in codes[start:start + TECH_BATCH_SIZE]]
+            print(f"Tech для {len(batch)} товаров категории {category[-40:]}...")
+            
+            try:
+                tables = generate_tech_specs_batch(ai_generator, batch, category)
+            except Exception as e:
+                print(f"  ✗ Ошибка пакетной генерации tech: {e}")
+                continue
+            
+            for vendor_code, _ in batch:
+                tech_specs = tables.get(vendor_code)
+                if is_valid_tech_table(tech_specs):
+                    patches_journal.append(vendor_code, 'tech', tech_specs)
+                    processed += 1
+                    print(f"  ✓ {vendor_code}: добавлены технические характеристики ({len(tech_specs)} символов)")
+                else:
+                    print(f"  ✗ {vendor_code}: не удалось сгенерировать tech")
+    
+    return processed
+
+def apply_feed_patches(patches_journal: ResultJournal) -> bool:
+    """
+    Применяет накопленные правки к feed-yml-0.xml и убирает примененные из журнала
+
+    Returns:
+        True, если все правки применены; непримененные остаются в журнале
+    """
+    pending = patches_journal.load()
+    patches = {}
+    for (vendor_code, tag), content in pending.items():
+        patches.setdefault(vendor_code, {})[tag] = content
+    
+    patches_journal.close()
+    if not patches:
+        return True
+    
+    try:
+        with stage('write_feed', rows=len(patches)):
+            patched = write_patched_feed('feed-yml-0.xml', 'feed-yml-0.xml', patches)
+    except Exception as e:
+        # Исходный фид не тронут, правки остаются в журнале до следующего запуска
+        print(f"\nОшибка сохранения XML: {e}")
+        print(f"Правки сохранены в {PATCHES_PATH} и будут применены при следующем запуске")
+        return False
+    
+    # Правки товаров, которых не нашлось в фиде, сохраняем до следующего запуска
+    unapplied = {key: content for key, content in pending.items() if key[0] not in patched}
+    patches_journal.rewrite(unapplied)
+    print(f"Применено правок к {len(patched)} товарам в feed-yml-0.xml")
+    if unapplied:
+        missing = sorted({vendor_code for vendor_code, _ in unapplied})
+        print(f"Не найдены в фиде {len(missing)} товаров ({', '.join(missing[:10])}); "
+              f"их правки оставлены в {PATCHES_PATH}")
+        return False
+    return True
 
 def main():
     """Добавляет description и tech в XML файл там, где их нет"""
     
     # Получаем API ключ
-    env_api_key = os.getenv('API_KEY')
-    
-    if env_api_key:
-        print(f"Найден API ключ в .env: {env_api_key[:20]}...")
-        use_env = input("Использовать ключ из .env? (y/n): ").lower().strip()
-        
-        if use_env == 'y':
-            api_key = env_api_key
-            print("Используется API ключ из .env")
-        else:
-            api_key = input("Введите ваш API ключ: ").strip()
-    else:
-        print("Файл .env не найден или API_KEY не указан")
-        api_key = input("Введите ваш API ключ: ").strip()
+    api_key = get_api_key()
     
     if not api_key:
         print("API ключ не указан. Завершение работы.")
-        return
+        sys.exit(1)
     
     # Создаем генератор ИИ
     ai_generator = AIContentGenerator(api_key)
     
     # Загружаем каталог для получения названий и категорий
     try:
-        catalog_df = pd.read_csv('catalog6_new.csv', sep=';', encoding='utf-8-sig')
+        catalog_df = read_table(find_stage('catalog6_new'))
         print(f"Загружен каталог с {len(catalog_df)} товарами")
     except FileNotFoundError:
-        print("Файл catalog6_new.csv не найден. Сначала запустите update_catalog.py")
-        return
+        print(f"Файл {stage_path('catalog6_new')} не найден. Сначала запустите update_catalog.py")
+        sys.exit(1)
     
-    # Создаем словарь артикул -> данные товара
-    product_data = {}
-    for _, row in catalog_df.iterrows():
-        artikul = str(row['Артикул']).strip()
-        product_data[artikul] = {
-            'name': str(row['Наименование']),
-            'category': str(row['Категория: 1']),
-            'price': str(row['Цена'])
-        }
-    
-    # Загружаем XML
-    try:
-        tree = ET.parse('feed-yml-0.xml')
-        root = tree.getroot()
-        print("XML файл загружен")
-    except FileNotFoundError:
+    # Создаем словарь артикул -> данные товара (технические товары определяются одним вызовом по всему каталогу)
+    names = catalog_df['Наименование'].astype(str)
+    categories = catalog_df['Категория: 1'].astype(str)
+    product_data = {
+        artikul: {'name': name, 'category': category, 'price': price, 'technical': technical}
+        for artikul, name, category, price, technical in zip(
+            catalog_df['Артикул'].astype(str).str.strip(),
+            names,
+            categories,
+            catalog_df['Цена'].astype(str),
+            classify_technical(names, categories)
+        )
+    }
+    
+    # Индекс фида перестраивается только если XML изменился
+    if not os.path.exists('feed-yml-0.xml'):
         print("Файл feed-yml-0.xml не найден")
-        return
+        sys.exit(1)
+    with stage('feed_index') as record:
+        feed_index = FeedIndex.load_or_build('feed-yml-0.xml')
+        record['rows'] = len(feed_index)
+    
+    # Правки прошлого прерванного запуска считаются уже сделанными
+    patches_journal = ResultJournal(PATCHES_PATH)
+    pending_patches = patches_journal.load()
+    
+    # Отладочная информация для первых 5 товаров
+    for debug_count, (vendor_code, entry) in enumerate(list(feed_index.offers.items())[:5]):
+        name = entry['name'] if entry['name'] is not None else 'Нет названия'
+        desc_status = 'Нет элемента' if entry['description'] is None else ('Пустой' if entry['description'] == 0 else f"Есть ({entry['description']} симв.)")
+        tech_status = 'Нет элемента' if entry['tech'] is None else ('Пустой' if entry['tech'] == 0 else f"Есть ({entry['tech']} симв.)")
+        print(f"Отладка {debug_count + 1}: {vendor_code} - {name[:30]}... - Description: {desc_status}, Tech: {tech_status}")
     
-    # Ищем товары без description и/или tech
+    diff = feed_index.diff_catalog(product_data)
+    missing_description = set(feed_index.missing('description'))
+    missing_tech = set(feed_index.missing('tech'))
+    
+    # Ищем товары каталога без description и/или tech
     offers_to_process = []
-    offers_with_desc = 0
-    offers_with_tech = 0
-    debug_count = 0
-    
-    for offer in root.findall('.//offer'):
-        vendor_code_elem = offer.find('vendorCode')
-        if vendor_code_elem is not None:
-            vendor_code = vendor_code_elem.text.strip()
-            description_elem = offer.find('description')
-            tech_elem = offer.find('tech')
-            
-            # Отладочная информация для первых 5 товаров
-            if debug_count < 5:
-                name_elem = offer.find('name')
-                name = name_elem.text if name_elem is not None else 'Нет названия'
-                desc_status = 'Нет элемента' if description_elem is None else ('Пустой' if not description_elem.text or description_elem.text.strip() == '' else f'Есть ({len(description_elem.text)} симв.)')
-                tech_status = 'Нет элемента' if tech_elem is None else ('Пустой' if not tech_elem.text or tech_elem.text.strip() == '' else f'Есть ({len(tech_elem.text)} симв.)')
-                print(f"Отладка {debug_count + 1}: {vendor_code} - {name[:30]}... - Description: {desc_status}, Tech: {tech_status}")
-                debug_count += 1
-            
-            # Проверяем отсутствие description
-            has_description = False
-            if description_elem is not None and description_elem.text:
-                desc_text = description_elem.text.strip()
-                if desc_text and desc_text != '' and not desc_text.isspace():
-                    has_description = True
-                    offers_with_desc += 1
-            
-            # Проверяем отсутствие tech
-            has_tech = False
-            if tech_elem is not None and tech_elem.text:
-                tech_text = tech_elem.text.strip()
-                if tech_text and tech_text != '' and not tech_text.isspace():
-                    has_tech = True
-                    offers_with_tech += 1
-            
-            # Добавляем в список для обработки если нужно
-            if vendor_code in product_data:
-                product = product_data[vendor_code]
-                needs_description = not has_description
-                needs_tech = not has_tech and is_technical_product(product['name'], product['category'])
-                
-                if needs_description or needs_tech:
-                    offers_to_process.append((offer, vendor_code, needs_description, needs_tech))
+    for vendor_code in diff['matched']:
+        product = product_data[vendor_code]
+        needs_description = vendor_code in missing_description and (vendor_code, 'description') not in pending_patches
+        needs_tech = (vendor_code in missing_tech and (vendor_code, 'tech') not in pending_patches
+                      and product['technical'])
+        
+        if needs_description or needs_tech:
+            offers_to_process.append((vendor_code, feed_index.get(vendor_code)['name'], needs_description, needs_tech))
     
-    total_offers = len(root.findall('.//offer'))
-    print(f"Всего товаров в XML: {total_offers}")
-    print(f"Товаров с описанием: {offers_with_desc}")
-    print(f"Товаров с tech: {offers_with_tech}")
+    print(f"Всего товаров в XML: {len(feed_index)}")
+    print(f"Товаров с описанием: {len(feed_index) - len(missing_description)}")
+    print(f"Товаров с tech: {len(feed_index) - len(missing_tech)}")
+    print(f"Товаров каталога нет в XML: {len(diff['only_catalog'])}")
     print(f"Товаров для обработки: {len(offers_to_process)}")
     
+    if pending_patches:
+        print(f"Несохраненных правок из прошлого запуска: {len(pending_patches)}")
+    
     if len(offers_to_process) == 0:
+        # Ненулевой код выхода: pipeline.py не должен считать непропатченный фид актуальным
+        if not apply_feed_patches(patches_journal):
+            sys.exit(1)
         print("Все товары уже имеют необходимые поля!")
         return
     
     # Показываем примеры товаров для обработки
     print(f"\nПримеры товаров для обработки:")
-    for i, (offer, vendor_code, needs_desc, needs_tech) in enumerate(offers_to_process[:3]):
-        name_elem = offer.find('name')
-        name = name_elem.text if name_elem is not None else 'Нет названия'
+    for i, (vendor_code, name, needs_desc, needs_tech) in enumerate(offers_to_process[:3]):
+        name = name if name is not None else 'Нет названия'
         actions = []
         if needs_desc:
             actions.append("description")
@@ -191,81 +298,77 @@ def main():
         print(f"  {i+1}. {vendor_code} - {name[:40]}... - Нужно: {', '.join(actions)}")
     
     # Подтверждение
-    proceed = input(f"\nОбработать {len(offers_to_process)} товаров? (y/n): ").lower().strip()
-    if proceed != 'y':
+    if not confirm(f"\nОбработать {len(offers_to_process)} товаров?"):
         print("Отменено.")
-        return
+        sys.exit(1)
     
     # Обрабатываем товары
     print("\nНачинаю обработку товаров...")
     processed_desc = 0
     processed_tech = 0
     
-    for i, (offer, vendor_code, needs_desc, needs_tech) in enumerate(offers_to_process):
-        product = product_data[vendor_code]
-        print(f"Товар {i + 1}/{len(offers_to_process)}: {product['name'][:40]}...")
-        
-        try:
-            # Генерируем описание если нужно
-            if needs_desc:
-                temp_row = pd.Series({
-                    'Наименование': product['name'],
-                    'Категория: 1': product['category'],
-                    'Цена': product['price']
-                })
-                
-                description = ai_generator.generate_description_from_tech(temp_row, {})
-                
-                if description:
-                    description_elem = offer.find('description')
-                    if description_elem is None:
-                        description_elem = ET.SubElement(offer, 'description')
-                    
-                    description_elem.text = description
-                    processed_desc += 1
-                    print(f"  ✓ Добавлено описание ({len(description)} символов)")
+    with stage('llm', rows=len(offers_to_process)):
+        for i, (vendor_code, _, needs_desc, needs_tech) in enumerate(offers_to_process):
+            product = product_data[vendor_code]
+            print(f"Товар {i + 1}/{len(offers_to_process)}: {product['name'][:40]}...")
             
-            # Генерируем tech если нужно
-            if needs_tech:
-                tech_specs = generate_tech_specs(ai_generator, product['name'], product['category'])
-                
-                if tech_specs and '<table>' in tech_specs:
-                    tech_elem = offer.find('tech')
-                    if tech_elem is None:
-                        tech_elem = ET.SubElement(offer, 'tech')
+            try:
+                # Генерируем описание если нужно
+                if needs_desc:
+                    temp_row = pd.Series({
+                        'Наименование': product['name'],
+                        'Категория: 1': product['category'],
+                        'Цена': product['price']
+                    })
                     
-                    tech_elem.text = tech_specs
-                    processed_tech += 1
-                    print(f"  ✓ Добавлены технические характеристики ({len(tech_specs)} символов)")
-                else:
-                    print(f"  ✗ Не удалось сгенерировать tech")
+                    with request_context('description', vendor_code):
+                        description = ai_generator.generate_description_from_tech(temp_row, {})
                     
-        except Exception as e:
-            print(f"  ✗ Ошибка обработки {vendor_code}: {e}")
-        
-        # Промежуточное сохранение каждые 10 товаров
-        if (i + 1) % 10 == 0:
-            try:
-                tree.write('feed-yml-0.xml', encoding='utf-8', xml_declaration=True)
-                print(f"  Промежуточное сохранение ({i + 1} товаров)")
+                    if description:
+                        patches_journal.append(vendor_code, 'description', description)
+                        processed_desc += 1
+                        print(f"  ✓ Добавлено описание ({len(description)} символов)")
+                    else:
+                        print(f"  ✗ Не удалось сгенерировать описание")
+                
+                # Генерируем tech если нужно (пакетами - после описаний)
+                if needs_tech and TECH_BATCH_SIZE <= 1:
+                    with request_context('tech', vendor_code):
+                        tech_specs = generate_tech_specs(ai_generator, product['name'], product['category'])
+                    
+                    if is_valid_tech_table(tech_specs):
+                        patches_journal.append(vendor_code, 'tech', tech_specs)
+                        processed_tech += 1
+                        print(f"  ✓ Добавлены технические характеристики ({len(tech_specs)} символов)")
+                    else:
+                        print(f"  ✗ Не удалось сгенерировать tech")
+                        
             except Exception as e:
-                print(f"  Ошибка сохранения: {e}")
+                print(f"  ✗ Ошибка обработки {vendor_code}: {e}")
+        
+        if TECH_BATCH_SIZE > 1:
+            processed_tech += generate_tech_in_batches(
+                ai_generator, patches_journal, product_data,
+                [vendor_code for vendor_code, _, _, needs_tech in offers_to_process if needs_tech]
+            )
     
-    # Финальное сохранение
-    try:
-        tree.write('feed-yml-0.xml', encoding='utf-8', xml_declaration=True)
-        print(f"\nГотово! Добавлено {processed_desc} описаний и {processed_tech} tech полей. XML файл обновлен.")
-    except Exception as e:
-        print(f"\nОшибка финального сохранения: {e}")
-        # Сохраняем резервную копию
-        try:
-            import datetime
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = f'feed-yml-0_backup_{timestamp}.xml'
-            tree.write(backup_name, encoding='utf-8', xml_declaration=True)
-            print(f"Резервная копия сохранена как {backup_name}")
-        except Exception as e2:
-            print(f"Не удалось сохранить резервную копию: {e2}")
+    if ai_generator.cache:
+        print(ai_generator.cache.stats())
+    print(ai_generator.metrics.summary())
+    ai_generator.close()
+    
+    # Один проход записи вместо промежуточных сохранений всего дерева
+    if not apply_feed_patches(patches_journal):
+        sys.exit(1)
+    print(f"\nГотово! Добавлено {processed_desc} описаний и {processed_tech} tech полей. XML файл обновлен.")
+    
+    # Ненулевой код выхода: pipeline.py не должен считать фид без этих полей актуальным
+    planned = sum(needs_desc + needs_tech for _, _, needs_desc, needs_tech in offers_to_process)
+    failed = planned - processed_desc - processed_tech
+    if failed:
+        print(f"Не удалось сгенерировать {failed} полей, они будут сгенерированы при следующем запуске")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with stage('add_descriptions_to_xml'):
+        main()
\ No newline at end of file
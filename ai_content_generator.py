@@ -1,32 +1,130 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import pandas as pd
 import time
 import re
 import os
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
+from rate_limiter import RateLimiter, backoff_delay, parse_retry_after
+from response_cache import ResponseCache
+from request_metrics import RequestMetrics, request_context, take_queue_wait
 
 # Загружаем переменные окружения
 load_dotenv()
 
+SYSTEM_PROMPT = "Ты эксперт по SEO и созданию контента для интернет-магазинов."
+TEMPERATURE = 0.7
+
+# Поля каталога, которые заполняет ИИ
+AI_FIELDS = ['SEO Titile', 'SEO Meta Description', 'SEO Meta Keywords', 'Краткое описание', 'Описание']
+
+# Ключи JSON ответа и требования для комбинированной генерации полей
+COMBINED_FIELD_SPECS = {
+    'SEO Titile': ('title', 'SEO заголовок до 60 символов с ключевыми словами'),
+    'SEO Meta Description': ('meta_description', 'META описание 150-160 символов с ценой и основными характеристиками'),
+    'SEO Meta Keywords': ('keywords', '5-10 ключевых слов через запятую без повторений'),
+    'Краткое описание': ('short_description', '1-2 предложения до 200 символов об основных преимуществах'),
+    'Описание': ('description', '2-3 предложения об основных характеристиках и применении')
+}
+
+def is_empty_value(value) -> bool:
+    """Проверяет, что значение поля каталога не заполнено"""
+    return value is None or (not isinstance(value, str) and pd.isna(value)) or value == ''
+
+def parse_combined_response(response: str, fields: List[str]) -> Dict[str, str]:
+    """Разбирает JSON ответ комбинированной генерации и оставляет только корректные поля"""
+    # Модели часто оборачивают JSON в ```json ... ``` или добавляют текст вокруг
+    start = response.find('{')
+    end = response.rfind('}')
+    if start == -1 or end <= start:
+        return {}
+    
+    try:
+        data = json.loads(response[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    
+    results = {}
+    for field in fields:
+        value = data.get(COMBINED_FIELD_SPECS[field][0])
+        if isinstance(value, list):
+            value = ', '.join(str(item).strip() for item in value)
+        if isinstance(value, str) and value.strip():
+            results[field] = value.strip()
+    
+    return results
+
 class AIContentGenerator:
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(self, api_key: str = None, model: str = None, max_workers: int = None, combined: bool = None):
         """
         Инициализация генератора контента
         
         Args:
             api_key: API ключ для OpenRouter (если None, загружается из .env)
             model: Модель для использования (если None, загружается из .env)
+            max_workers: Количество одновременных запросов (если None, загружается из .env)
+            combined: Генерировать все пустые поля одним JSON запросом (если None, загружается из .env)
         """
         self.api_key = api_key or os.getenv('API_KEY')
         self.model = model or os.getenv('MODEL', 'deepseek/deepseek-chat')
+        self.max_workers = max_workers or int(os.getenv('AI_CONCURRENCY', '4'))
+        # Генерировать все пустые поля товара одним запросом
+        self.combined = combined if combined is not None else os.getenv('AI_COMBINED', '0') == '1'
         
         if not self.api_key:
             raise ValueError("Не указан API ключ. Укажите в параметрах или в файле .env")
+        if self.max_workers < 1:
+            raise ValueError("Количество одновременных запросов должно быть не меньше 1")
+        
+        # Общий для всех потоков бюджет запросов и токенов
+        tokens_per_minute = os.getenv('AI_TPM')
+        self.rate_limiter = RateLimiter(
+            requests_per_second=float(os.getenv('AI_RPS', '2')),
+            tokens_per_minute=int(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.max_retries = int(os.getenv('AI_MAX_RETRIES', '5'))
+        # Адрес можно заменить, например на локальный mock_openrouter.py
+        self.api_url = os.getenv('API_URL', "https://openrouter.ai/api/v1/chat/completions")
+        
+        # Одна сессия с keep-alive на все запросы: TLS-соединения переиспользуются
+        self.timeout = (float(os.getenv('AI_CONNECT_TIMEOUT', '10')), float(os.getenv('AI_READ_TIMEOUT', '60')))
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Постоянный кэш ответов (пустой AI_CACHE отключает кэш)
+        cache_path = os.getenv('AI_CACHE', 'ai_cache.sqlite')
+        cache_ttl = os.getenv('AI_CACHE_TTL')
+        cache_max_entries = os.getenv('AI_CACHE_MAX_ENTRIES')
+        self.cache = ResponseCache(
+            cache_path,
+            ttl=float(cache_ttl) if cache_ttl else None,
+            max_entries=int(cache_max_entries) if cache_max_entries else None
+        ) if cache_path else None
         
-        self.delay = 1  # Задержка между запросами в секундах
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        # Метрики каждого запроса (пустой AI_METRICS - только итоговая сводка)
+        self.metrics = RequestMetrics(
+            os.getenv('AI_METRICS') or None,
+            prompt_price=float(os.getenv('AI_PRICE_PROMPT', '0')),
+            completion_price=float(os.getenv('AI_PRICE_COMPLETION', '0'))
+        )
+    
+    def close(self):
+        """Закрывает HTTP сессию, соединения пула, кэш и файл метрик"""
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+        self.metrics.close()
     
     def generate_seo_title(self, name: str, category: str, price: str) -> str:
         """Генерирует SEO заголовок для товара"""
@@ -161,68 +259,237 @@ class AIContentGenerator:
         
         return self._make_request(prompt, max_tokens=300)
     
+    def generate_all_fields(self, name: str, category: str, price: str, fields: List[str], description: str = "") -> Dict[str, str]:
+        """
+        Генерирует несколько полей товара одним запросом в виде JSON
+        
+        Returns:
+            Словарь поле -> контент только для полей, прошедших проверку
+        """
+        desc_part = f"\n        Описание: {description[:100]}..." if description else ""
+        requirements = "\n".join(
+            f'        - "{COMBINED_FIELD_SPECS[field][0]}": {COMBINED_FIELD_SPECS[field][1]}' for field in fields
+        )
+        
+        prompt = f"""
+        Создай SEO контент для товара:
+        Название: {name}
+        Категория: {category}
+        Цена: {price} руб.{desc_part}
+        
+        Верни JSON объект со следующими ключами:
+{requirements}
+        
+        Весь текст на русском языке, привлекательный для покупателя.
+        Верни только JSON без дополнительного текста.
+        """
+        
+        # Бюджет токенов как у отдельных запросов для этих полей
+        max_tokens = sum(300 if field == 'Описание' else 150 for field in fields)
+        return parse_combined_response(self._make_request(prompt, max_tokens=max_tokens), fields)
+    
     def _make_request(self, prompt: str, max_tokens: int = 150) -> str:
-        """Выполняет запрос к OpenRouter API"""
+        """Выполняет запрос к OpenRouter API с повторами при 429 и ошибках сервера и записывает его метрики"""
+        started = time.perf_counter()
+        stats = {
+            'status': 'failed', 'http_status': None, 'retries': 0, 'latency': 0.0,
+            'queue_wait': take_queue_wait(started), 'cache_hit': False,
+            'prompt_tokens': 0, 'completion_tokens': 0
+        }
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "Ты эксперт по SEO и созданию контента для интернет-магазинов."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7
-            }
+            return self._send_request(prompt, max_tokens, stats)
+        finally:
+            stats['latency'] = round(stats['latency'], 4)
+            stats['queue_wait'] = round(stats['queue_wait'], 4)
+            self.metrics.record(**stats)
+    
+    def _send_request(self, prompt: str, max_tokens: int, stats: Dict) -> str:
+        """
+        Запрос с повторами; заполняет stats статусом, повторами, ожиданием и токенами
+
+        latency - только время HTTP запросов к API; ожидание ограничителя и паузы
+        между повторами учитываются в queue_wait.
+        """
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": TEMPERATURE
+        }
+        
+        cache_key = None
+        if self.cache:
+            cache_key = ResponseCache.make_key(self.api_url, self.model, SYSTEM_PROMPT, prompt, max_tokens, TEMPERATURE)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                stats.update(status='ok', cache_hit=True)
+                return cached
+        
+        # Грубая оценка: около 3 символов на токен для русского текста
+        estimated_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 3 + max_tokens
+        
+        for attempt in range(self.max_retries + 1):
+            stats['retries'] = attempt
+            stats['queue_wait'] += self.rate_limiter.acquire(estimated_tokens)
             
-            response = requests.post(self.api_url, headers=headers, json=data)
+            request_started = time.perf_counter()
+            try:
+                response = self.session.post(self.api_url, json=data, timeout=self.timeout)
+            except Exception as e:
+                stats['latency'] += time.perf_counter() - request_started
+                print(f"Ошибка при запросе к API: {e}")
+                # После последней попытки ждать нечего
+                if attempt < self.max_retries:
+                    delay = backoff_delay(attempt)
+                    stats['queue_wait'] += delay
+                    time.sleep(delay)
+                continue
             
+            stats['latency'] += time.perf_counter() - request_started
+            stats['http_status'] = response.status_code
             if response.status_code == 200:
-                result = response.json()["choices"][0]["message"]["content"].strip()
+                try:
+                    payload = response.json()
+                    result = payload["choices"][0]["message"]["content"].strip()
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                    print(f"Некорректный ответ API: {e}")
+                    return ""
+                
+                self.rate_limiter.on_success()
+                usage = payload.get("usage") or {}
+                stats.update(
+                    status='ok',
+                    prompt_tokens=usage.get("prompt_tokens") or 0,
+                    completion_tokens=usage.get("completion_tokens") or 0
+                )
+                total_tokens = usage.get("total_tokens")
+                if total_tokens:
+                    self.rate_limiter.record_tokens(total_tokens - estimated_tokens)
+                
                 # Убираем теги <think> если есть
                 result = result.replace('<think>', '').replace('</think>', '')
-                time.sleep(self.delay)  # Задержка между запросами
+                if cache_key and result:
+                    self.cache.set(cache_key, result)
                 return result
-            else:
-                print(f"Ошибка API: {response.status_code}")
-                return ""
             
-        except Exception as e:
-            print(f"Ошибка при запросе к API: {e}")
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    # Пауза распространяется на все потоки через общий ограничитель
+                    self.rate_limiter.on_throttle(retry_after or backoff_delay(attempt))
+                elif attempt < self.max_retries:
+                    delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                    stats['queue_wait'] += delay
+                    time.sleep(delay)
+                print(f"Ошибка API: {response.status_code}, попытка {attempt + 1}/{self.max_retries + 1}")
+                continue
+            
+            print(f"Ошибка API: {response.status_code}")
             return ""
+        
+        print(f"Не удалось получить ответ API за {self.max_retries + 1} попыток")
+        return ""
     
-    def process_catalog_row(self, row: pd.Series) -> Dict[str, str]:
-        """Обрабатывает одну строку каталога и генерирует весь контент"""
+    def _plan_row(self, row: pd.Series) -> Dict[str, Callable[[], str]]:
+        """Возвращает функции генерации для пустых полей строки каталога"""
         name = str(row['Наименование'])
         category = str(row['Категория: 1'])
         price = str(row['Цена'])
-        artikul = str(row['Артикул'])
         description = str(row.get('Описание', ''))
         
-        results = {}
+        plan = {}
         
         # Генерируем только если поле пустое
-        if pd.isna(row.get('SEO Titile')) or row.get('SEO Titile') == '':
-            results['SEO Titile'] = self.generate_seo_title(name, category, price)
+        if is_empty_value(row.get('SEO Titile')):
+            plan['SEO Titile'] = lambda: self.generate_seo_title(name, category, price)
             
-        if pd.isna(row.get('SEO Meta Description')) or row.get('SEO Meta Description') == '':
-            results['SEO Meta Description'] = self.generate_meta_description(name, category, price, description)
+        if is_empty_value(row.get('SEO Meta Description')):
+            plan['SEO Meta Description'] = lambda: self.generate_meta_description(name, category, price, description)
             
-        if pd.isna(row.get('SEO Meta Keywords')) or row.get('SEO Meta Keywords') == '':
-            results['SEO Meta Keywords'] = self.generate_meta_keywords(name, category)
-            
-
+        if is_empty_value(row.get('SEO Meta Keywords')):
+            plan['SEO Meta Keywords'] = lambda: self.generate_meta_keywords(name, category)
             
-        if pd.isna(row.get('Краткое описание')) or row.get('Краткое описание') == '':
-            results['Краткое описание'] = self.generate_short_description(name, category, price)
+        if is_empty_value(row.get('Краткое описание')):
+            plan['Краткое описание'] = lambda: self.generate_short_description(name, category, price)
         
         # Генерируем описание если пустое
-        if pd.isna(row.get('Описание')) or row.get('Описание') == '':
-            results['Описание'] = self.generate_description_from_tech(row, None)
+        if is_empty_value(row.get('Описание')):
+            plan['Описание'] = lambda: self.generate_description_from_tech(row, None)
+        
+        return plan
+    
+    def _plan_tasks(self, row: pd.Series) -> List[Callable[[], Dict[str, str]]]:
+        """Разбивает генерацию пустых полей строки на задачи (одна задача - один или несколько полей)"""
+        plan = self._plan_row(row)
+        sku = None if is_empty_value(row.get('Артикул')) else str(row.get('Артикул'))
+        # Строка планируется, когда в пуле освобождается место: от этого момента считается ожидание в очереди
+        queued = time.perf_counter()
+        
+        def in_context(field: str, generate: Callable[[], Dict[str, str]]) -> Callable[[], Dict[str, str]]:
+            def run() -> Dict[str, str]:
+                with request_context(field, sku, queued):
+                    return generate()
+            return run
         
+        if not self.combined or len(plan) < 2:
+            return [
+                in_context(field, lambda field=field, generate=generate: {field: generate()})
+                for field, generate in plan.items()
+            ]
+        
+        def generate_combined() -> Dict[str, str]:
+            description = row.get('Описание')
+            results = self.generate_all_fields(
+                str(row['Наименование']), str(row['Категория: 1']), str(row['Цена']), list(plan),
+                "" if is_empty_value(description) else str(description)
+            )
+            # Поля, которые не удалось разобрать, генерируем отдельными запросами
+            for field, generate in plan.items():
+                if field not in results:
+                    with request_context(field, sku):
+                        results[field] = generate()
+            return results
+        
+        return [in_context('combined', generate_combined)]
+    
+    def process_catalog_row(self, row: pd.Series) -> Dict[str, str]:
+        """Обрабатывает одну строку каталога и генерирует весь контент"""
+        results = {}
+        for task in self._plan_tasks(row):
+            results.update(task())
         return results
-
+    
+    def iter_catalog_results(self, rows: Iterable[Tuple[object, pd.Series]]) -> Iterator[Tuple[object, str, str]]:
+        """
+        Генерирует контент для строк каталога, держа в работе до max_workers запросов
+        
+        Args:
+            rows: Пары (индекс, строка), например catalog_df.iterrows()
+        
+        Yields:
+            Кортежи (индекс, поле, контент) в порядке готовности
+        """
+        tasks = ((index, task) for index, row in rows for task in self._plan_tasks(row))
+        pending = {}
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Держим очередь заполненной, но не ставим весь каталог сразу
+                while len(pending) < self.max_workers * 2:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    index, generate = task
+                    pending[executor.submit(generate)] = index
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    for field, content in future.result().items():
+                        yield index, field, content
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import pandas as pd
+
+from ai_content_generator import AIContentGenerator
+from clean_ai_content import clean_series
+from feed_index import FeedIndex
+from feed_reader import iter_offers
+from final_update_catalog_format_description import apply_properties, format_description, parse_tech_properties
+from html_tables import TableParseCache
+from mock_openrouter import MockOpenRouterServer
+from update_catalog import build_catalog_records, merge_catalog
+
+RESULTS_PATH = 'benchmark_results.jsonl'
+
+CATEGORIES = ['Фрезерные станки', 'Строгальные станки', 'Шлифовальные станки', 'Пилы ленточные', 'Пылесосы']
+SERIES = ['PF', 'SPA', 'BP', 'SD', 'FH']
+
+def git_revision() -> str:
+    """Текущий коммит, чтобы результаты разных версий можно было сравнить"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+def synthetic_products(size: int, seed: int = 0) -> List[Dict]:
+    """Синтетические товары: серии моделей с разными размерами внутри категории"""
+    rng = random.Random(seed)
+    products = []
+    for number in range(size):
+        category = CATEGORIES[number % len(CATEGORIES)]
+        series = SERIES[number % len(SERIES)]
+        products.append({
+            'artikul': f"{100000 + number}",
+            'name': f"Станок {series}-{200 + number % 300} {rng.choice(['220В', '380В'])}",
+            'category': category,
+            'price': rng.randint(5, 900) * 1000
+        })
+    return products
+
+def make_price(products: List[Dict]) -> pd.DataFrame:
+    """Прайс в формате price_new: строки-заголовки категорий и строки товаров"""
+    rows = []
+    by_category = {}
+    for product in products:
+        by_category.setdefault(product['category'], []).append(product)
+    for category, items in by_category.items():
+        rows.append({'Unnamed: 0': None, 'Unnamed: 1': category, 'Unnamed: 2': None})
+        rows.extend({'Unnamed: 0': item['artikul'], 'Unnamed: 1': item['name'], 'Unnamed: 2': item['price']} for item in items)
+    return pd.DataFrame(rows)
+
+def make_catalog(products: List[Dict]) -> pd.DataFrame:
+    """Каталог в формате catalog6 с пустыми полями для ИИ (у половины товаров есть описание)"""
+    return pd.DataFrame({
+        'Артикул': [product['artikul'] for product in products],
+        'Наименование': ['Proma ' + product['name'] for product in products],
+        'Цена': [f"{product['price']},00" for product in products],
+        'Категория: 1': ['Каталог >> Деревообрабатывающее оборудование >> ' + product['category'] for product in products],
+        'Описание': [f"Описание {product['name']}" if number % 2 else None for number, product in enumerate(products)],
+        'Фото товара': None,
+        'SEO Titile': None,
+        'SEO Meta Keywords': None,
+        'SEO Meta Description': None,
+        'Краткое описание': None
+    })
+
+def make_feed(path: str, products: List[Dict]):
+    """Пишет YML фид с описанием, характеристиками и комплектацией каждого товара"""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<yml_catalog><shop><offers>\n')
+        for number, product in enumerate(products):
+            tech = ''.join(
+                f"<tr><td>Параметр {param}</td><td>{(number * 7 + param) % 1000} мм</td></tr>" for param in range(8)
+            )
+            equipment = ''.join(f"<tr><td>Деталь {item}</td><td>{item + 1} шт</td></tr>" for item in range(3))
+            file.write(
+                f'<offer id="{number}"><name>{product["name"]}</name>'
+                f'<vendorCode>{product["artikul"]}</vendorCode>'
+                f'<picture>https://example.com/{product["artikul"]}.jpg</picture>'
+                f'<description><![CDATA[<p>Описание {product["name"]}</p><p>Вторая строка</p>]]></description>'
+                f'<tech><![CDATA[<table>{tech}</table>]]></tech>'
+                f'<equipment><![CDATA[<table><tr><td>Наименование</td><td>Кол-во</td></tr>{equipment}</table>]]></equipment>'
+                '</offer>\n'
+            )
+        file.write('</offers></shop></yml_catalog>\n')
+
+def time_stage(name: str, func: Callable[[], int]) -> Dict:
+    """Выполняет этап и возвращает время (func возвращает количество обработанных строк)"""
+    start = time.perf_counter()
+    rows = func()
+    seconds = time.perf_counter() - start
+    print(f"  {name}: {seconds:.3f} с, {rows} строк ({rows / seconds if seconds else 0:.0f} строк/с)")
+    return {'stage': name, 'seconds': round(seconds, 4), 'rows': rows}
+
+def format_feed(feed_path: str, catalog_df: pd.DataFrame) -> int:
+    """Разбор характеристик и форматирование описаний как в final_update_catalog_format_description"""
+    cache = TableParseCache(path=None)
+    records = []
+    properties = set()
+    for offer in iter_offers(feed_path):
+        tech = parse_tech_properties(offer['tech'] or '', cache)
+        properties.update(tech)
+        format_description(offer['description'] or '', offer['equipment'] or '', cache)
+        records.extend((offer['vendor_code'], f"Свойство: {name}:", value) for name, value in tech.items())
+    apply_properties(catalog_df, records, [f"Свойство: {name}:" for name in sorted(properties)])
+    return len(catalog_df)
+
+def run_ai(catalog_df: pd.DataFrame, rows: int) -> int:
+    """Генерация пустых полей через mock сервер, как в full_catalog_with_ai"""
+    generator = AIContentGenerator('benchmark')
+    try:
+        return sum(1 for _ in generator.iter_catalog_results(catalog_df.head(rows).iterrows()))
+    finally:
+        generator.close()
+
+def run_ai_rows(catalog_df: pd.DataFrame, rows: int) -> int:
+    """Последовательный process_catalog_row: задержка одного товара без параллелизма"""
+    generator = AIContentGenerator('benchmark', max_workers=1)
+    try:
+        for _, row in catalog_df.head(rows).iterrows():
+            generator.process_catalog_row(row)
+        return rows
+    finally:
+        generator.close()
+
+def run_clean(size: int) -> int:
+    """Очистка сгенерированного текста с think-блоками, тегами и HTML-кодами"""
+    values = pd.Series([f"<think>план {number}</think><p>**Станок** &quot;{number}&quot;</p>  " for number in range(size)])
+    clean_series(values)
+    return size
+
+def benchmark_size(size: int, args: argparse.Namespace, workdir: str) -> List[Dict]:
+    """Все этапы на синтетических данных одного размера"""
+    print(f"\nРазмер {size} товаров:")
+    products = synthetic_products(size, seed=args.seed)
+    price_df = make_price(products)
+    catalog_df = make_catalog(products)
+    feed_path = os.path.join(workdir, f'feed-{size}.xml')
+    make_feed(feed_path, products)
+
+    ai_rows = min(size, args.ai_rows)
+    stages = [
+        ('update_catalog', lambda: len(merge_catalog(catalog_df.iloc[: size // 2], build_catalog_records(price_df))[0])),
+        ('feed_index', lambda: len(FeedIndex.build(feed_path))),
+        ('xml_parse', lambda: sum(1 for _ in iter_offers(feed_path))),
+        ('format', lambda: format_feed(feed_path, catalog_df)),
+        ('clean', lambda: run_clean(size)),
+        ('ai_generate', lambda: run_ai(catalog_df, ai_rows)),
+        ('ai_process_row', lambda: run_ai_rows(catalog_df, min(ai_rows, args.sequential_rows)))
+    ]
+    return [dict(time_stage(name, func), size=size) for name, func in stages if not args.stages or name in args.stages]
+
+def load_previous(path: str) -> Dict:
+    """Последние результаты (размер, этап) -> запись из прошлых запусков"""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    previous[(record['size'], record['stage'])] = record
+                except (ValueError, KeyError):
+                    continue
+    return previous
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов обработки каталога на синтетических данных без сети")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="размеры каталога")
+    parser.add_argument('--stages', nargs='+', help="только указанные этапы")
+    parser.add_argument('--ai-rows', type=int, default=200, help="сколько товаров генерировать через mock сервер")
+    parser.add_argument('--sequential-rows', type=int, default=10, help="товаров для последовательного process_catalog_row")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа mock сервера в секундах")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--burst-every', type=int, default=0, help="период серий ответов 429 (в запросах)")
+    parser.add_argument('--burst-length', type=int, default=0, help="длина серии ответов 429")
+    parser.add_argument('--concurrency', type=int, default=8, help="AI_CONCURRENCY для генерации")
+    parser.add_argument('--rps', type=float, default=50, help="AI_RPS для генерации")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=RESULTS_PATH, help="файл результатов JSONL")
+    args = parser.parse_args()
+
+    server = MockOpenRouterServer(latency=args.latency, error_rate=args.error_rate, burst_every=args.burst_every,
+                                  burst_length=args.burst_length, retry_after=0.5, seed=args.seed)
+    # Генератор читает настройки из окружения; кэш отключен, чтобы каждый запуск шел в сервер,
+    # а метрики не попадают в файл метрик рабочих запусков
+    os.environ.update({
+        'API_URL': server.url,
+        'AI_CACHE': '',
+        'AI_METRICS': '',
+        'AI_CONCURRENCY': str(args.concurrency),
+        'AI_RPS': str(args.rps)
+    })
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_rev': git_revision(),
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'burst_every': args.burst_every,
+        'burst_length': args.burst_length,
+        'concurrency': args.concurrency
+    }
+    previous = load_previous(args.output)
+
+    results = []
+    with server, tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results.extend(benchmark_size(size, args, workdir))
+        print(f"\nMock сервер: {server.requests} запросов, {server.errors} ошибок 500, {server.throttled} ответов 429")
+
+    with open(args.output, 'a', encoding='utf-8') as file:
+        for result in results:
+            file.write(json.dumps(dict(run, **result), ensure_ascii=False) + '\n')
+
+    print(f"\nСравнение с прошлым запуском ({args.output}):")
+    for result in results:
+        before = previous.get((result['size'], result['stage']))
+        if before and before['seconds']:
+            change = (result['seconds'] / before['seconds'] - 1) * 100
+            print(f"  {result['size']:>7} {result['stage']:<15} {before['seconds']:.3f} -> {result['seconds']:.3f} с "
+                  f"({change:+.0f}%, было {before.get('git_rev')})")
+        else:
+            print(f"  {result['size']:>7} {result['stage']:<15} {result['seconds']:.3f} с (нет прошлых данных)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import functools
+import importlib.util
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+def _parquet_available() -> bool:
+    """Проверяет, установлен ли движок для Parquet"""
+    return any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet'))
+
+@functools.lru_cache(maxsize=None)
+def intermediate_extension() -> str:
+    """Расширение промежуточных файлов: .parquet при CATALOG_FORMAT=parquet, иначе .csv"""
+    if os.getenv('CATALOG_FORMAT', 'csv').lower() == 'parquet':
+        if _parquet_available():
+            return '.parquet'
+        print("CATALOG_FORMAT=parquet, но pyarrow не установлен - используется CSV")
+    return '.csv'
+
+def stage_path(name: str) -> str:
+    """Путь для записи промежуточной таблицы этапа (имя без расширения)"""
+    return name + intermediate_extension()
+
+def find_stage(name: str) -> str:
+    """
+    Путь для чтения промежуточной таблицы этапа
+
+    Если файла в настроенном формате нет, используется файл в другом формате
+    (например, CSV от запуска до включения Parquet).
+    """
+    preferred = stage_path(name)
+    if os.path.exists(preferred):
+        return preferred
+    for extension in ('.parquet', '.csv'):
+        if os.path.exists(name + extension):
+            return name + extension
+    return preferred
+
+def read_table(path: str, sep: str = ';') -> pd.DataFrame:
+    """Читает таблицу из Parquet или CSV (UTF-8 с BOM) по расширению файла"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, sep=sep, encoding='utf-8-sig')
+
+def write_table(df: pd.DataFrame, path: str, sep: str = ';'):
+    """Сохраняет таблицу в Parquet или CSV (UTF-8 с BOM) по расширению файла"""
+    if not path.endswith('.parquet'):
+        df.to_csv(path, sep=sep, index=False, encoding='utf-8-sig')
+        return
+
+    # Parquet требует один тип на столбец: смешанные значения сохраняем строками
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        df[column] = values.where(values.isna(), values.astype(str))
+    df.to_parquet(path, index=False)
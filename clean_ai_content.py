@@ -1,19 +1,48 @@
 import pandas as pd
-import re
+from catalog_io import find_stage, read_table, write_table
+from profiling import stage
 
-def clean_ai_generated_content(csv_file: str, output_file: str = None):
+# Правила очистки: (название, регулярное выражение, замена). Применяются по порядку
+CLEANING_RULES = [
+    ('Блоки <think>', r'(?s)<think>.*?</think>', ''),
+    ('HTML теги', r'<[^>]+>', ''),
+    ('HTML-коды', r'&(?:[a-zA-Z]+|#\d+|#x[0-9a-fA-F]+);', ' '),
+    ('Звездочки', r'\*', ''),
+    ('Кавычки', r'["\']', ''),
+    ('Лишние пробелы', r'\s+', ' ')
+]
+
+def clean_series(values: pd.Series, rules: list = CLEANING_RULES) -> tuple:
+    """
+    Применяет правила очистки ко всему столбцу
+
+    Returns:
+        (очищенные значения, словарь правило -> количество измененных ячеек)
+    """
+    rule_counts = {}
+    for name, pattern, replacement in rules:
+        cleaned = values.str.replace(pattern, replacement, regex=True)
+        rule_counts[name] = int((cleaned != values).sum())
+        values = cleaned
+
+    return values.str.strip(), rule_counts
+
+def clean_ai_generated_content(csv_file: str, output_file: str = None, rules: list = CLEANING_RULES):
     """
     Очищает AI сгенерированный контент от нежелательных символов
     
     Args:
-        csv_file: Путь к CSV файлу для очистки
+        csv_file: Путь к CSV или Parquet файлу для очистки
         output_file: Путь для сохранения (по умолчанию перезаписывает исходный)
+        rules: Правила очистки (по умолчанию CLEANING_RULES)
     """
     if output_file is None:
         output_file = csv_file
     
     # Загружаем каталог
-    df = pd.read_csv(csv_file, sep=';', encoding='utf-8-sig')
+    with stage('load') as record:
+        df = read_table(csv_file)
+        record['rows'] = len(df)
     
     # Поля для очистки
     fields_to_clean = ['SEO Titile', 'SEO Meta Keywords', 'SEO Meta Description', 'SEO H1', 'Краткое описание']
@@ -21,27 +50,35 @@ def clean_ai_generated_content(csv_file: str, output_file: str = None):
     print(f"Очищаю {len(df)} товаров...")
     
     cleaned_count = 0
+    summary = {name: 0 for name, _, _ in rules}
+    
+    with stage('clean', rows=len(df)):
+        for field in fields_to_clean:
+            if field in df.columns:
+                filled = df[field].notna() & (df[field] != '')
+                original_values = df.loc[filled, field].astype(str)
+        
+                cleaned_values, rule_counts = clean_series(original_values, rules)
+                for name, count in rule_counts.items():
+                    summary[name] += count
+        
+                changed = cleaned_values != original_values
+                if changed.any():
+                    df[field] = df[field].astype(object)
+                    df.loc[changed[changed].index, field] = cleaned_values[changed]
+                    cleaned_count += int(changed.sum())
+                    print(f"  {field}: очищено {int(changed.sum())} значений")
     
-    for field in fields_to_clean:
-        if field in df.columns:
-            for index, value in df[field].items():
-                if pd.notna(value) and value != '':
-                    original_value = str(value)
-                    
-                    # Убираем звездочки и кавычки
-                    cleaned_value = original_value.replace('*', '').replace('"', '').replace("'", '')
-                    
-                    # Убираем лишние пробелы
-                    cleaned_value = re.sub(r'\s+', ' ', cleaned_value).strip()
-                    
-                    if cleaned_value != original_value:
-                        df.at[index, field] = cleaned_value
-                        cleaned_count += 1
-                        print(f"Очищено {field} для товара {index + 1}: {original_value[:30]}... -> {cleaned_value[:30]}...")
+    print("\nСтатистика по правилам:")
+    for name, count in summary.items():
+        print(f"  {name}: {count} значений")
     
     # Сохраняем результат
-    df.to_csv(output_file, sep=';', index=False, encoding='utf-8-sig')
+    with stage('save', rows=len(df)):
+        write_table(df, output_file)
     print(f"\nОчистка завершена! Очищено {cleaned_count} полей. Результат сохранен в {output_file}")
 
 if __name__ == "__main__":
-    clean_ai_generated_content('catalog6_ai_filled.csv', 'catalog6_ai_cleaned.csv')
\ No newline at end of file
+    # Финальный экспорт для CMS всегда в CSV
+    with stage('clean_ai_content'):
+        clean_ai_generated_content(find_stage('catalog6_ai_filled'), 'catalog6_ai_cleaned.csv')
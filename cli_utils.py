@@ -0,0 +1,33 @@
+import os
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+def non_interactive() -> bool:
+    """Запуск без вопросов пользователю (ASSUME_YES=1, например из pipeline.py)"""
+    return os.getenv('ASSUME_YES', '0') == '1'
+
+def confirm(question: str) -> bool:
+    """Спрашивает подтверждение (y/n); в неинтерактивном режиме всегда соглашается"""
+    if non_interactive():
+        print(f"{question} (y/n): y")
+        return True
+    return input(f"{question} (y/n): ").lower().strip() == 'y'
+
+def get_api_key() -> str:
+    """Возвращает API ключ из .env (с подтверждением) или введенный пользователем"""
+    env_api_key = os.getenv('API_KEY')
+
+    if env_api_key:
+        print(f"Найден API ключ в .env: {env_api_key[:20]}...")
+
+        if confirm("Использовать ключ из .env?"):
+            print("Используется API ключ из .env")
+            return env_api_key
+        return input("Введите ваш API ключ: ").strip()
+
+    print("Файл .env не найден или API_KEY не указан")
+    if non_interactive():
+        return ""
+    return input("Введите ваш API ключ: ").strip()
@@ -1,9 +1,122 @@
+import json
+import os
+import sys
+from typing import Dict
+
 import requests
+from dotenv import load_dotenv
+
+from atomic_file import atomic_write
+
+# Загружаем переменные окружения
+load_dotenv()
+
+FEED_URL = os.getenv('FEED_URL', "https://www.stankiproma.ru/wp-content/uploads/feed-yml-0.xml")
+FEED_PATH = 'feed-yml-0.xml'
+CHUNK_SIZE = 1 << 20
+
+def metadata_path(path: str) -> str:
+    """Файл с ETag и Last-Modified последней загрузки"""
+    return path + '.download.json'
+
+def load_metadata(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except ValueError:
+        return {}
+
+def save_metadata(path: str, metadata: Dict):
+    with atomic_write(path, 'w', encoding='utf-8') as file:
+        json.dump(metadata, file, ensure_ascii=False, indent=2)
+
+def validators(response: requests.Response) -> Dict:
+    """ETag и Last-Modified из ответа сервера"""
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+
+def download_feed(url: str = FEED_URL, path: str = FEED_PATH, session: requests.Session = None) -> bool:
+    """
+    Скачивает фид потоково, только если он изменился на сервере
+
+    Файл записывается частями во временный файл path + '.part' и после
+    завершения атомарно заменяет path. Прерванная загрузка продолжается
+    запросом Range, если сервер его поддерживает и файл не изменился.
+
+    Returns:
+        True, если файл обновлен; False, если сервер ответил 304 (не изменился)
+    """
+    session = session or requests.Session()
+    part_path = path + '.part'
+    meta_file = metadata_path(path)
+    part_meta_file = metadata_path(part_path)
+
+    metadata = load_metadata(meta_file) if os.path.exists(path) else {}
+    if metadata.get('url') != url:
+        metadata = {}
+
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+
+    # Докачка: диапазон считается по несжатым байтам, поэтому без gzip
+    part_meta = load_metadata(part_meta_file)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset and part_meta.get('url') == url and (part_meta.get('etag') or part_meta.get('last_modified')):
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = part_meta.get('etag') or part_meta['last_modified']
+        headers['Accept-Encoding'] = 'identity'
+    else:
+        offset = 0
+        headers['Accept-Encoding'] = 'gzip, deflate'
+
+    with session.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+        if response.status_code == 304:
+            print(f"Фид не изменился на сервере, {path} оставлен без изменений")
+            return False
+
+        if response.status_code == 416 and 'Range' in headers:
+            # Недокачанный файл не подходит к текущей версии на сервере - начинаем заново
+            os.remove(part_path)
+            os.remove(part_meta_file)
+            return download_feed(url, path, session)
+
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            print(f"Продолжаю загрузку с {offset} байт")
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+
+        new_metadata = dict(validators(response), url=url)
+        save_metadata(part_meta_file, new_metadata)
+
+        downloaded = offset
+        with open(part_path, mode) as file:
+            # iter_content распаковывает gzip на лету
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+                downloaded += len(chunk)
+            file.flush()
+            os.fsync(file.fileno())
 
-url = "https://www.stankiproma.ru/wp-content/uploads/feed-yml-0.xml"
-response = requests.get(url)
+    os.replace(part_path, path)
+    save_metadata(meta_file, new_metadata)
+    os.remove(part_meta_file)
+    print(f"Файл скачан: {path} ({downloaded} байт)")
+    return True
 
-with open("feed-yml-0.xml", "wb") as file:
-    file.write(response.content)
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else FEED_URL
+    download_feed(url)
 
-print("Файл скачан")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
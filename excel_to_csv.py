@@ -1,9 +1,69 @@
+import argparse
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
 import pandas as pd
 
-# Читаем лист "Деревообработка"
-df = pd.read_excel('PROMA_VISPROM_Прайс_лист_с_15_09_2025_курс_86.xlsx', sheet_name='Деревообработка')
+from catalog_io import stage_path, write_table
+from profiling import stage
+
+PRICE_WORKBOOK = 'PROMA_VISPROM_Прайс_лист_с_15_09_2025_курс_86.xlsx'
+DEFAULT_SHEETS = ['Деревообработка']
+
+def excel_engine() -> str:
+    """Движок чтения Excel: calamine (Rust, в разы быстрее), если установлен, иначе openpyxl"""
+    return 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+def read_sheet(workbook_path: str, sheet_name: str) -> pd.DataFrame:
+    """Читает один лист (пустые заголовки столбцов получают имена 'Unnamed: N')"""
+    return pd.read_excel(workbook_path, sheet_name=sheet_name, engine=excel_engine())
+
+def list_sheets(workbook_path: str) -> List[str]:
+    """Названия всех листов книги"""
+    with pd.ExcelFile(workbook_path, engine=excel_engine()) as workbook:
+        return workbook.sheet_names
+
+def read_price_list(workbook_path: str, sheet_names: List[str], max_workers: int = None) -> pd.DataFrame:
+    """
+    Читает листы прайса (несколько листов - параллельно в отдельных процессах)
+
+    Returns:
+        Одна таблица со столбцом 'Лист'; столбцы листов сопоставляются по заголовкам
+    """
+    if len(sheet_names) == 1:
+        sheets = [read_sheet(workbook_path, sheet_names[0])]
+    else:
+        workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            sheets = list(executor.map(read_sheet, [workbook_path] * len(sheet_names), sheet_names))
+
+    return pd.concat(
+        [sheet.assign(Лист=name) for name, sheet in zip(sheet_names, sheets)],
+        ignore_index=True
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Конвертирует листы Excel прайс-листа в таблицу price_new")
+    parser.add_argument('workbook', nargs='?', default=PRICE_WORKBOOK, help="файл Excel прайс-листа")
+    parser.add_argument('--sheet', action='append', dest='sheets', metavar='NAME',
+                        help="лист для конвертации (можно указать несколько раз)")
+    parser.add_argument('--all-sheets', action='store_true', help="конвертировать все листы книги")
+    args = parser.parse_args()
+
+    sheet_names = list_sheets(args.workbook) if args.all_sheets else (args.sheets or DEFAULT_SHEETS)
+    with stage('read_sheets') as record:
+        df = read_price_list(args.workbook, sheet_names)
+        record['rows'] = len(df)
+
+    # Сохраняем в CSV с правильной кодировкой
+    output_path = stage_path('price_new')
+    with stage('save', rows=len(df)):
+        write_table(df, output_path, sep=',')
 
-# Сохраняем в CSV с правильной кодировкой
-df.to_csv('price_new.csv', encoding='utf-8-sig', index=False)
+    print(f"Excel файл конвертирован в {output_path}: {len(df)} строк из листов {', '.join(sheet_names)}")
 
-print("Excel файл конвертирован в price_new.csv")
\ No newline at end of file
+if __name__ == "__main__":
+    with stage('excel_to_csv'):
+        main()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional
+
+from atomic_file import atomic_write
+from feed_reader import iter_feed_segments
+
+# Поля товара, для которых в индексе хранится длина текста
+INDEXED_FIELDS = ['description', 'tech', 'equipment']
+
+def _file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FeedIndex:
+    """
+    Индекс YML фида: vendorCode -> смещение блока <offer> и сводка его полей
+
+    Индекс сохраняется рядом с фидом и перестраивается только если у фида
+    изменилось время модификации и хэш содержимого.
+    """
+
+    def __init__(self, feed_path: str, offers: Dict[str, Dict], source: Dict):
+        self.feed_path = feed_path
+        self.offers = offers
+        self.source = source
+
+    @staticmethod
+    def index_path(feed_path: str) -> str:
+        return feed_path + '.index.json'
+
+    @classmethod
+    def build(cls, feed_path: str = 'feed-yml-0.xml') -> 'FeedIndex':
+        """Строит индекс за один потоковый проход по фиду"""
+        offers = {}
+        digest = hashlib.sha256()
+
+        for offset, data, is_offer in iter_feed_segments(feed_path):
+            digest.update(data)
+            if not is_offer:
+                continue
+
+            offer = ET.fromstring(data)
+            vendor_code = (offer.findtext('vendorCode') or '').strip()
+            if not vendor_code:
+                continue
+
+            entry = {'offset': offset, 'length': len(data), 'name': offer.findtext('name')}
+            for field in INDEXED_FIELDS:
+                elem = offer.find(field)
+                # None - элемента нет, 0 - элемент пустой
+                entry[field] = None if elem is None else len((elem.text or '').strip())
+            offers[vendor_code] = entry
+
+        stat = os.stat(feed_path)
+        source = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+        return cls(feed_path, offers, source)
+
+    @classmethod
+    def load_or_build(cls, feed_path: str = 'feed-yml-0.xml') -> 'FeedIndex':
+        """Загружает сохраненный индекс или перестраивает его, если фид изменился"""
+        index_path = cls.index_path(feed_path)
+        stat = os.stat(feed_path)
+
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, encoding='utf-8') as file:
+                    data = json.load(file)
+                source = data['source']
+
+                if source['mtime_ns'] == stat.st_mtime_ns and source['size'] == stat.st_size:
+                    return cls(feed_path, data['offers'], source)
+
+                # Файл мог быть перезаписан тем же содержимым
+                if source['size'] == stat.st_size and source['sha256'] == _file_sha256(feed_path):
+                    index = cls(feed_path, data['offers'], dict(source, mtime_ns=stat.st_mtime_ns))
+                    index.save()
+                    return index
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        index = cls.build(feed_path)
+        index.save()
+        return index
+
+    def save(self):
+        """Сохраняет индекс рядом с фидом"""
+        with atomic_write(self.index_path(self.feed_path), 'w', encoding='utf-8') as file:
+            json.dump({'source': self.source, 'offers': self.offers}, file, ensure_ascii=False)
+
+    def __contains__(self, vendor_code: str) -> bool:
+        return vendor_code in self.offers
+
+    def __len__(self) -> int:
+        return len(self.offers)
+
+    def get(self, vendor_code: str) -> Optional[Dict]:
+        """Сводка полей товара или None"""
+        return self.offers.get(vendor_code)
+
+    def has_field(self, vendor_code: str, field: str) -> bool:
+        """Есть ли у товара непустое поле"""
+        entry = self.offers.get(vendor_code)
+        return bool(entry and entry.get(field))
+
+    def read_offer(self, vendor_code: str) -> Optional[ET.Element]:
+        """Читает и разбирает только блок нужного товара, без разбора всего фида"""
+        entry = self.offers.get(vendor_code)
+        if entry is None:
+            return None
+        with open(self.feed_path, 'rb') as file:
+            file.seek(entry['offset'])
+            return ET.fromstring(file.read(entry['length']))
+
+    def missing(self, field: str) -> List[str]:
+        """vendorCode товаров, у которых поле отсутствует или пустое"""
+        return [vendor_code for vendor_code, entry in self.offers.items() if not entry.get(field)]
+
+    def diff_catalog(self, artikuls: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Сравнивает артикулы каталога с товарами фида
+
+        Returns:
+            Словарь со списками 'matched', 'only_catalog' и 'only_feed'
+        """
+        catalog_codes = list(dict.fromkeys(str(artikul).strip() for artikul in artikuls))
+        catalog_set = set(catalog_codes)
+        return {
+            'matched': [code for code in catalog_codes if code in self.offers],
+            'only_catalog': [code for code in catalog_codes if code not in self.offers],
+            'only_feed': [code for code in self.offers if code not in catalog_set]
+        }
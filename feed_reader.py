@@ -0,0 +1,93 @@
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, Optional, Tuple
+
+def _element_text(offer: ET.Element, tag: str) -> Optional[str]:
+    """Текст дочернего элемента: None если элемента нет, '' если он пустой"""
+    elem = offer.find(tag)
+    if elem is None:
+        return None
+    return elem.text or ''
+
+def iter_offers(path: str = 'feed-yml-0.xml') -> Iterator[Dict]:
+    """
+    Потоково читает товары из YML фида
+
+    Каждый <offer> удаляется из дерева сразу после разбора, поэтому память
+    не растет с размером фида.
+
+    Yields:
+        Словари с ключами vendor_code, name, description, tech, equipment, pictures
+    """
+    stack = []
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag != 'offer':
+            continue
+
+        vendor_code = _element_text(elem, 'vendorCode')
+        yield {
+            'vendor_code': vendor_code.strip() if vendor_code else None,
+            'name': _element_text(elem, 'name'),
+            'description': _element_text(elem, 'description'),
+            'tech': _element_text(elem, 'tech'),
+            'equipment': _element_text(elem, 'equipment'),
+            'pictures': [pic.text for pic in elem.findall('picture') if pic.text]
+        }
+
+        # Освобождаем разобранный товар
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+OFFER_START = re.compile(rb'<offer[\s>]')
+OFFER_END = b'</offer>'
+
+def iter_feed_segments(path: str = 'feed-yml-0.xml', chunk_size: int = 1 << 20) -> Iterator[Tuple[int, bytes, bool]]:
+    """
+    Потоково делит файл фида на блоки <offer>...</offer> и текст между ними
+
+    Блоки возвращаются байт в байт, поэтому их конкатенация дает исходный файл.
+
+    Yields:
+        Кортежи (смещение в байтах, данные, является ли блок товаром)
+    """
+    buffer = b''
+    buffer_offset = 0  # Смещение buffer[0] в файле
+    pos = 0
+    eof = False
+
+    with open(path, 'rb') as file:
+        while True:
+            match = OFFER_START.search(buffer, pos)
+            end = buffer.find(OFFER_END, match.end()) if match else -1
+
+            if match and end != -1:
+                if match.start() > pos:
+                    yield buffer_offset + pos, buffer[pos:match.start()], False
+                end += len(OFFER_END)
+                yield buffer_offset + match.start(), buffer[match.start():end], True
+                pos = end
+                continue
+
+            if eof:
+                if pos < len(buffer):
+                    yield buffer_offset + pos, buffer[pos:], False
+                return
+
+            # Текст до начала незавершенного блока можно отдать сразу,
+            # хвост оставляем - в нем может быть начало тега <offer
+            keep_from = match.start() if match else max(pos, len(buffer) - len(b'<offer '))
+            if keep_from > pos:
+                yield buffer_offset + pos, buffer[pos:keep_from], False
+
+            chunk = file.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer_offset += keep_from
+            buffer = buffer[keep_from:] + chunk
+            pos = 0
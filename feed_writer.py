@@ -0,0 +1,61 @@
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional, Set
+
+from atomic_file import atomic_write
+from feed_reader import iter_feed_segments
+
+def offer_vendor_code(block: str) -> Optional[str]:
+    """vendorCode товара так же, как его читает FeedIndex (с учетом CDATA и сущностей)"""
+    try:
+        vendor_code = ET.fromstring(block).findtext('vendorCode')
+    except ET.ParseError:
+        return None
+    return vendor_code.strip() if vendor_code else None
+
+def _cdata(content: str) -> str:
+    """Оборачивает текст в CDATA, разбивая вложенные ']]>'"""
+    return '<![CDATA[' + content.replace(']]>', ']]]]><![CDATA[>') + ']]>'
+
+def patch_offer_block(block: str, fields: Dict[str, str]) -> str:
+    """
+    Заменяет или добавляет элементы внутри текста одного <offer>
+
+    Остальная разметка товара (включая CDATA) сохраняется без изменений.
+    """
+    for tag, content in fields.items():
+        element = f'<{tag}>{_cdata(content)}</{tag}>'
+        pattern = re.compile(rf'<{tag}(?:\s[^>]*)?/>|<{tag}(?:\s[^>]*)?>.*?</{tag}>', re.S)
+        block, replaced = pattern.subn(lambda _: element, block, count=1)
+        if not replaced:
+            end = block.rfind('</offer>')
+            block = block[:end] + element + '\n' + block[end:]
+    return block
+
+def write_patched_feed(source: str, destination: str, patches: Dict[str, Dict[str, str]], encoding: str = 'utf-8') -> Set[str]:
+    """
+    Записывает фид с примененными правками за один потоковый проход
+
+    Неизмененные товары копируются байт в байт, файл заменяется атомарно,
+    поэтому source и destination могут совпадать.
+
+    Args:
+        source: Исходный XML фид
+        destination: Куда записать результат
+        patches: vendorCode -> {тег: новый текст}
+        encoding: Кодировка фида
+
+    Returns:
+        vendorCode товаров, к которым применены правки
+    """
+    patched = set()
+    with atomic_write(destination) as output:
+        for _, data, is_offer in iter_feed_segments(source):
+            if is_offer and patches:
+                block = data.decode(encoding)
+                vendor_code = offer_vendor_code(block)
+                if vendor_code in patches:
+                    data = patch_offer_block(block, patches[vendor_code]).encode(encoding)
+                    patched.add(vendor_code)
+            output.write(data)
+    return patched
@@ -1,54 +1,34 @@
-import xml.etree.ElementTree as ET
+import time
+
 import pandas as pd
-from bs4 import BeautifulSoup
+from catalog_io import find_stage, read_table, stage_path, write_table
+from feed_reader import iter_offers
+from html_tables import TableParseCache, extract_table_rows
+from profiling import stage
 
-def parse_tech_properties(tech_text):
+def parse_tech_properties(tech_text, cache=None):
     """Парсит технические характеристики из HTML таблицы"""
-    if not tech_text:
-        return {}
-    
-    soup = BeautifulSoup(tech_text, 'html.parser')
-    table = soup.find('table')
-    if not table:
-        return {}
+    rows = cache.rows(tech_text) if cache else extract_table_rows(tech_text)
     
     properties = {}
-    rows = table.find_all('tr')
-    
-    for row in rows:
-        cells = row.find_all(['td', 'th'])
-        if len(cells) >= 2:
-            name = cells[0].get_text(strip=True)
-            value = cells[1].get_text(strip=True)
-            if name and value:
-                properties[name] = value
+    for name, value in rows:
+        if name and value:
+            properties[name] = value
     
     return properties
 
-def parse_equipment_to_list(equipment_text):
+def parse_equipment_to_list(equipment_text, cache=None):
     """Парсит комплектацию из таблицы"""
-    if not equipment_text:
-        return []
-    
-    soup = BeautifulSoup(equipment_text, 'html.parser')
-    table = soup.find('table')
-    if not table:
-        return []
+    rows = cache.rows(equipment_text) if cache else extract_table_rows(equipment_text)
     
     equipment_items = []
-    rows = table.find_all('tr')
-    
-    for row in rows:
-        cells = row.find_all(['td', 'th'])
-        if len(cells) >= 2:
-            name = cells[0].get_text(strip=True)
-            value = cells[1].get_text(strip=True)
-            if name and value and name != 'Наименование':
-                equipment_items.append(f"{name}: {value}")
+    for name, value in rows:
+        if name and value and name != 'Наименование':
+            equipment_items.append(f"{name}: {value}")
     
     return equipment_items
 
-def format_description(description_text, equipment_text):
+def format_description(description_text, equipment_text, cache=None):
     """Форматирует описание без tech"""
     result = ""
     char_count = 0
@@ -67,7 +47,7 @@ def format_description(description_text, equipment_text):
     
     # Добавляем комплектацию
     if equipment_text:
-        equipment_items = parse_equipment_to_list(equipment_text)
+        equipment_items = parse_equipment_to_list(equipment_text, cache)
         if equipment_items:
             start_pos = char_count
             char_count += 15
@@ -94,77 +74,111 @@ def format_description(description_text, equipment_text):
     
     return result
 
-# Основной код
-tree = ET.parse('feed-yml-0.xml')
-root = tree.getroot()
-catalog_df = pd.read_csv('catalog6_new.csv', sep=';')
-
-# Собираем все возможные свойства из XML
-all_properties = set()
-offers = root.findall('.//offer')
-
-for offer in offers:
-    tech = offer.find('tech')
-    if tech is not None and tech.text:
-        tech_clean = tech.text.replace('<![CDATA[', '').replace(']]>', '')
-        properties = parse_tech_properties(tech_clean)
-        all_properties.update(properties.keys())
-
-# Добавляем недостающие столбцы свойств
-existing_columns = list(catalog_df.columns)
-for prop in all_properties:
-    column_name = f"Свойство: {prop}:"
-    if column_name not in existing_columns:
-        catalog_df[column_name] = ""
-
-# Обрабатываем XML данные
-xml_data = {}
-for offer in offers:
-    vendor_code = offer.find('vendorCode')
-    if vendor_code is not None:
-        description = offer.find('description')
-        tech = offer.find('tech')
-        equipment = offer.find('equipment')
-        pictures = offer.findall('picture')
-        
-        # Собираем фото
-        all_photos = [pic.text for pic in pictures if pic.text]
-        photos_string = ";".join(all_photos)
-        
-        # Парсим технические характеристики
-        tech_properties = {}
-        if tech is not None and tech.text:
-            tech_clean = tech.text.replace('<![CDATA[', '').replace(']]>', '')
-            tech_properties = parse_tech_properties(tech_clean)
-        
-        # Форматируем описание
-        desc_text = description.text if description is not None and description.text else ""
-        equip_text = equipment.text if equipment is not None and equipment.text else ""
-        formatted_description = format_description(desc_text, equip_text)
-        
-        xml_data[vendor_code.text] = {
-            'photos': photos_string,
-            'description': formatted_description,
-            'properties': tech_properties
-        }
+def apply_properties(catalog_df, property_records, property_columns):
+    """
+    Заполняет столбцы свойств каталога из записей (артикул, столбец, значение)
+    
+    Записи разворачиваются в широкую таблицу одним pivot и присоединяются по Артикулу.
+    Существующие значения перезаписываются, новые столбцы добавляются одной операцией.
+    """
+    properties = pd.DataFrame(property_records, columns=['Артикул', 'Столбец', 'Значение'])
+    properties = properties.drop_duplicates(['Артикул', 'Столбец'], keep='last')
+    wide = properties.pivot(index='Артикул', columns='Столбец', values='Значение')
+    aligned = wide.reindex(catalog_df['Артикул'].astype(str))
+    aligned.index = catalog_df.index
+    
+    updated_columns = {}
+    new_columns = {}
+    for column in property_columns:
+        values = aligned[column] if column in aligned.columns else pd.Series(index=catalog_df.index, dtype=object)
+        if column in catalog_df.columns:
+            updated_columns[column] = values.where(values.notna(), catalog_df[column].astype(object))
+        else:
+            new_columns[column] = values.fillna("")
+    
+    catalog_df = catalog_df.assign(**updated_columns) if updated_columns else catalog_df
+    if new_columns:
+        catalog_df = pd.concat([catalog_df, pd.DataFrame(new_columns, index=catalog_df.index)], axis=1)
+    
+    return catalog_df
 
-# Обновляем каталог
-for index, row in catalog_df.iterrows():
-    artikul = str(row['Артикул'])
-    if artikul in xml_data:
-        # Обновляем фото
-        if pd.isna(row['Фото товара']) or row['Фото товара'] == '':
-            catalog_df.at[index, 'Фото товара'] = xml_data[artikul]['photos']
-        
-        # Обновляем описание
-        if pd.isna(row['Описание']) or row['Описание'] == '':
-            catalog_df.at[index, 'Описание'] = xml_data[artikul]['description']
+def main():
+    """Добавляет в каталог фото, описания и свойства из XML фида"""
+    with stage('load') as record:
+        catalog_df = read_table(find_stage('catalog6_new'))
+        record['rows'] = len(catalog_df)
+    
+    # Каждая HTML таблица разбирается один раз, результаты кэшируются между запусками
+    table_cache = TableParseCache()
+    
+    # Собираем свойства и данные товаров
+    all_properties = set()
+    xml_data = {}
+    
+    # Один потоковый проход по XML; время разбора HTML таблиц считается отдельно
+    html_parse_time = 0.0
+    with stage('offers') as record:
+        record['rows'] = 0
+        loop_start = time.perf_counter()
+        for offer in iter_offers('feed-yml-0.xml'):
+            record['rows'] += 1
+            html_start = time.perf_counter()
+            
+            # Парсим технические характеристики
+            tech_properties = {}
+            if offer['tech']:
+                tech_clean = offer['tech'].replace('<![CDATA[', '').replace(']]>', '')
+                tech_properties = parse_tech_properties(tech_clean, table_cache)
+                all_properties.update(tech_properties.keys())
+            
+            if offer['vendor_code'] is None:
+                html_parse_time += time.perf_counter() - html_start
+                continue
+            
+            # Собираем фото
+            photos_string = ";".join(offer['pictures'])
+            
+            # Форматируем описание
+            formatted_description = format_description(offer['description'] or "", offer['equipment'] or "", table_cache)
+            html_parse_time += time.perf_counter() - html_start
+            
+            xml_data[offer['vendor_code']] = {
+                'photos': photos_string,
+                'description': formatted_description,
+                'properties': tech_properties
+            }
         
-        # Обновляем свойства
-        for prop_name, prop_value in xml_data[artikul]['properties'].items():
-            column_name = f"Свойство: {prop_name}:"
-            if column_name in catalog_df.columns:
-                catalog_df.at[index, column_name] = prop_value
+        record['xml_parse'] = round(time.perf_counter() - loop_start - html_parse_time, 4)
+        record['html_parse'] = round(html_parse_time, 4)
+        table_cache.save()
+    print(f"Разбор XML: {record['xml_parse']:.3f} с, разбор HTML таблиц: {record['html_parse']:.3f} с")
+    print(f"HTML таблицы: {table_cache.hits} из кэша, {table_cache.misses} разобрано")
+    
+    artikuls = catalog_df['Артикул'].astype(str)
+    matched = artikuls.isin(xml_data.keys())
+    
+    # Обновляем фото и описание там, где они пустые
+    for column, key in [('Фото товара', 'photos'), ('Описание', 'description')]:
+        values = artikuls.map({vendor_code: data[key] for vendor_code, data in xml_data.items()})
+        mask = matched & (catalog_df[column].isna() | (catalog_df[column] == ''))
+        catalog_df[column] = catalog_df[column].astype(object)
+        catalog_df.loc[mask, column] = values[mask]
+    
+    # Обновляем свойства: длинный формат (артикул, свойство, значение) -> одна сводная таблица
+    with stage('pivot') as record:
+        property_records = [
+            (vendor_code, f"Свойство: {prop_name}:", prop_value)
+            for vendor_code, data in xml_data.items()
+            for prop_name, prop_value in data['properties'].items()
+        ]
+        record['rows'] = len(property_records)
+        catalog_df = apply_properties(catalog_df, property_records, [f"Свойство: {prop}:" for prop in sorted(all_properties)])
+    
+    output_path = stage_path('catalog6_formatted')
+    with stage('save', rows=len(catalog_df)):
+        write_table(catalog_df, output_path)
+    print(f"Каталог с форматированными описаниями и свойствами сохранен как {output_path}")
 
-catalog_df.to_csv('catalog6_formatted.csv', sep=';', index=False, encoding='utf-8-sig')
-print("Каталог с форматированными описаниями и свойствами сохранен как catalog6_formatted.csv")
\ No newline at end of file
+if __name__ == "__main__":
+    with stage('final_update_catalog_format_description'):
+        main()
@@ -1,98 +1,285 @@
-from ai_content_generator import AIContentGenerator
+from ai_content_generator import AIContentGenerator, is_empty_value
+from result_journal import ResultJournal
+from near_duplicates import derive_variant_text, find_variant_groups
+from catalog_io import find_stage, read_table, stage_path, write_table
+from cli_utils import confirm, get_api_key
+from clean_ai_content import clean_series
+from atomic_file import atomic_write
+from profiling import stage
 import pandas as pd
+import json
 import os
+import sys
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
 load_dotenv()
 
-def main():
-    """Заполняет пустые поля каталога с помощью ИИ"""
+JOURNAL_PATH = 'catalog6_ai_journal.jsonl'
+HASHES_PATH = 'catalog6_ai_hashes.json'
+
+# Входные данные генерации: при их изменении SEO поля товара генерируются заново
+INPUT_COLUMNS = ['Наименование', 'Категория: 1', 'Цена', 'Описание']
+SEO_FIELDS = ['SEO Titile', 'SEO Meta Keywords', 'SEO Meta Description', 'Краткое описание']
+
+# Варианты одного товара (отличаются только числами в названии) получают тексты
+# базового товара с заменой отличающихся токенов названия вместо отдельных запросов к API
+DEDUP_ENABLED = os.getenv('AI_DEDUP', '0') == '1'
+DEDUP_THRESHOLD = float(os.getenv('AI_DEDUP_THRESHOLD', '0.8'))
+
+def row_input_hashes(catalog_df: pd.DataFrame) -> pd.Series:
+    """Хэши входных данных генерации для каждой строки (одним вызовом по всей таблице)"""
+    inputs = catalog_df.reindex(columns=INPUT_COLUMNS).astype(object)
+    inputs = inputs.where(inputs.notna(), '').astype(str)
+    return pd.util.hash_pandas_object(inputs, index=False).map('{:016x}'.format)
+
+def load_input_hashes(path: str = HASHES_PATH) -> dict:
+    """Читает хэши прошлого запуска: Артикул -> список допустимых хэшей"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except ValueError:
+        return {}
+
+def save_input_hashes(catalog_df: pd.DataFrame, input_hashes: pd.Series, known_hashes: dict, path: str = HASHES_PATH):
+    """
+    Сохраняет хэши входных данных рядом с результатом
+
+    Для каждого товара запоминаются хэш входа до генерации и после нее: если
+    сгенерированное описание вернется в каталог (или снова пропадет из него),
+    товар не будет считаться измененным.
+    """
+    output_hashes = row_input_hashes(catalog_df)
+    artikuls = catalog_df['Артикул'].astype(str)
+    hashes = {}
+    for artikul, before, after in zip(artikuls, input_hashes, output_hashes):
+        accepted = {before, after}
+        previous = known_hashes.get(artikul)
+        if isinstance(previous, list) and before in previous:
+            accepted.update(previous)
+        hashes[artikul] = sorted(accepted)
+
+    with atomic_write(path, 'w', encoding='utf-8') as file:
+        json.dump(hashes, file, ensure_ascii=False)
+
+def changed_rows(catalog_df: pd.DataFrame, input_hashes: pd.Series, known_hashes: dict) -> pd.Series:
+    """Маска товаров, входные данные которых изменились с прошлого запуска (новые товары не входят)"""
+    artikuls = catalog_df['Артикул'].astype(str)
+    known = artikuls.map(known_hashes)
+    return pd.Series(
+        [isinstance(hashes, list) and digest not in hashes for hashes, digest in zip(known, input_hashes)],
+        index=catalog_df.index
+    )
+
+def generated_fields(catalog_df: pd.DataFrame, rows: pd.Series, history: dict) -> pd.DataFrame:
+    """
+    Маска SEO полей строк rows, значение которых сгенерировано этим скриптом
+
+    Значение считается сгенерированным, если совпадает с записью журнала для
+    этого товара (как есть или после clean_ai_content.py). Поля, заполненные
+    вручную, в маску не попадают.
+    """
+    mask = pd.DataFrame(False, index=catalog_df.index, columns=SEO_FIELDS)
+    artikuls = catalog_df['Артикул'].astype(str)
+    for field in SEO_FIELDS:
+        for index in catalog_df.index[rows]:
+            value = catalog_df.at[index, field]
+            contents = history.get((artikuls[index], field))
+            if is_empty_value(value) or not contents:
+                continue
+            cleaned, _ = clean_series(pd.Series(sorted(contents), dtype=object))
+            mask.at[index, field] = str(value) in contents or str(value).strip() in set(cleaned)
+    return mask
+
+def apply_journal(catalog_df: pd.DataFrame, journal_results: dict) -> int:
+    """Заполняет пустые поля каталога результатами из журнала, возвращает количество заполненных"""
+    if not journal_results:
+        return 0
     
-    # Проверяем наличие API ключа в .env
-    env_api_key = os.getenv('API_KEY')
+    artikuls = catalog_df['Артикул'].astype(str)
+    applied = 0
     
-    if env_api_key:
-        print(f"Найден API ключ в .env: {env_api_key[:20]}...")
-        use_env = input("Использовать ключ из .env? (y/n): ").lower().strip()
+    for field in {field for _, field in journal_results}:
+        if field not in catalog_df.columns:
+            continue
         
-        if use_env == 'y':
-            api_key = env_api_key
-            print("Используется API ключ из .env")
-        else:
-            api_key = input("Введите ваш API ключ: ").strip()
-    else:
-        print("Файл .env не найден или API_KEY не указан")
-        api_key = input("Введите ваш API ключ: ").strip()
+        contents = {key: content for (key, journal_field), content in journal_results.items() if journal_field == field}
+        restored = artikuls.map(contents)
+        mask = catalog_df[field].map(is_empty_value) & restored.notna()
+        catalog_df.loc[mask, field] = restored[mask]
+        applied += int(mask.sum())
+    
+    return applied
+
+def derive_variants(catalog_df: pd.DataFrame, variants: dict, empty_mask: pd.DataFrame) -> list:
+    """
+    Заполняет пустые поля вариантов текстами базовых товаров
+
+    Returns:
+        Список (индекс, поле, текст) для заполненных полей; поля, для которых
+        подстановка небезопасна, остаются пустыми и генерируются отдельно
+    """
+    derived = []
+    for index, base_index in variants.items():
+        variant_name = str(catalog_df.at[index, 'Наименование'])
+        base_name = str(catalog_df.at[base_index, 'Наименование'])
+        variant_price = '' if pd.isna(catalog_df.at[index, 'Цена']) else str(catalog_df.at[index, 'Цена'])
+        base_price = '' if pd.isna(catalog_df.at[base_index, 'Цена']) else str(catalog_df.at[base_index, 'Цена'])
+
+        for field in empty_mask.columns[empty_mask.loc[index].values]:
+            base_content = catalog_df.at[base_index, field]
+            if is_empty_value(base_content):
+                continue
+            content = derive_variant_text(str(base_content), base_name, variant_name, base_price, variant_price)
+            if content:
+                catalog_df.at[index, field] = content
+                derived.append((index, field, content))
+    return derived
+
+def main():
+    """Заполняет пустые поля каталога с помощью ИИ"""
+    
+    # Получаем API ключ
+    api_key = get_api_key()
     
     if not api_key:
         print("API ключ не указан. Завершение работы.")
-        return
+        sys.exit(1)
     
     # Загружаем каталог
     try:
-        catalog_df = pd.read_csv('catalog6_formatted.csv', sep=';', encoding='utf-8-sig')
+        with stage('load') as record:
+            catalog_df = read_table(find_stage('catalog6_formatted'))
+            record['rows'] = len(catalog_df)
         print(f"Загружен каталог с {len(catalog_df)} товарами")
     except FileNotFoundError:
-        print("Файл catalog6_formatted.csv не найден. Сначала запустите final_update_catalog_format_description.py")
-        return
+        print(f"Файл {stage_path('catalog6_formatted')} не найден. Сначала запустите final_update_catalog_format_description.py")
+        sys.exit(1)
+    
+    output_path = stage_path('catalog6_ai_filled')
     
     # Создаем генератор ИИ
     ai_generator = AIContentGenerator(api_key)
     
-    # Подсчитываем пустые поля
     empty_fields = ['SEO Titile', 'SEO Meta Keywords', 'SEO Meta Description', 'Краткое описание', 'Описание']
-    total_empty = 0
+    
+    # Текстовые поля могут быть прочитаны как пустые float столбцы
+    catalog_df[empty_fields] = catalog_df[empty_fields].astype(object)
+    
+    # Товары с измененными входными данными генерируются заново, но только
+    # поля, сгенерированные этим скриптом (заполненные вручную не трогаем)
+    journal = ResultJournal(JOURNAL_PATH)
+    input_hashes = row_input_hashes(catalog_df)
+    known_hashes = load_input_hashes()
+    changed = changed_rows(catalog_df, input_hashes, known_hashes)
+    if changed.any():
+        stale = generated_fields(catalog_df, changed, journal.history())
+        for field in SEO_FIELDS:
+            catalog_df.loc[stale[field], field] = None
+        print(f"Изменились входные данные у {int(changed.sum())} товаров, "
+              f"сгенерированные SEO поля ({int(stale.values.sum())}) будут сгенерированы заново")
+    
+    # Восстанавливаем результаты прошлых запусков из журнала (только для тех же входных данных)
+    artikuls = catalog_df['Артикул'].astype(str)
+    restored = apply_journal(catalog_df, journal.load(dict(zip(artikuls, input_hashes))))
+    if restored:
+        print(f"Восстановлено из журнала {JOURNAL_PATH}: {restored} полей")
+    
+    # Подсчитываем пустые поля
+    empty_mask = catalog_df[empty_fields].isna() | (catalog_df[empty_fields] == '')
+    total_empty = int(empty_mask.values.sum())
     
     print("\nСтатистика пустых полей:")
     for field in empty_fields:
-        empty_count = catalog_df[field].isna().sum() + (catalog_df[field] == '').sum()
-        total_empty += empty_count
-        print(f"  {field}: {empty_count} пустых")
+        print(f"  {field}: {int(empty_mask[field].sum())} пустых")
     
     print(f"\nВсего пустых полей: {total_empty}")
     
     if total_empty == 0:
-        print("Все поля уже заполнены!")
+        write_table(catalog_df, output_path)
+        save_input_hashes(catalog_df, input_hashes, known_hashes)
+        print(f"Все поля уже заполнены! Результат сохранен в {output_path}")
         return
     
     # Подтверждение
-    proceed = input(f"\nЗаполнить {total_empty} пустых полей? (y/n): ").lower().strip()
-    if proceed != 'y':
+    if not confirm(f"\nЗаполнить {total_empty} пустых полей?"):
         print("Отменено.")
-        return
+        sys.exit(1)
     
-    # Обработка товаров
-    print("\nНачинаю обработку...")
+    # Обработка товаров: в очередь попадают только строки с пустыми полями
+    rows_to_process = catalog_df[empty_mask.any(axis=1)]
     processed = 0
+    failed = 0
     
-    for index, row in catalog_df.iterrows():
-        print(f"Товар {index + 1}/{len(catalog_df)}: {row['Наименование'][:40]}...")
-        
-        # Генерируем контент
-        generated_content = ai_generator.process_catalog_row(row)
-        
-        # Обновляем DataFrame
-        updated_fields = []
-        for field, content in generated_content.items():
+    def generate(rows: pd.DataFrame):
+        """Генерирует пустые поля строк и сразу фиксирует результаты в журнале"""
+        nonlocal processed, failed
+        print(f"\nНачинаю обработку {len(rows)} товаров ({ai_generator.max_workers} одновременных запросов)...")
+        for index, field, content in ai_generator.iter_catalog_results(rows.iterrows()):
+            name = str(catalog_df.at[index, 'Наименование'])
+            
+            # Обновляем DataFrame и сразу фиксируем результат в журнале
             if content:
                 catalog_df.at[index, field] = content
-                updated_fields.append(field)
+                journal.append(artikuls[index], field, content, input_hashes[index])
                 processed += 1
+                print(f"Товар {index + 1}/{len(catalog_df)}: {name[:40]}... обновлено: {field}")
+            else:
+                failed += 1
+                print(f"Товар {index + 1}/{len(catalog_df)}: {name[:40]}... не удалось: {field}")
+    
+    # Сначала генерируются базовые товары групп, варианты получают их тексты
+    variants = {}
+    if DEDUP_ENABLED:
+        with stage('dedup', rows=len(rows_to_process)):
+            variants = find_variant_groups(
+                zip(catalog_df.index, catalog_df['Наименование'].fillna('').astype(str), catalog_df['Категория: 1'].fillna('').astype(str)),
+                DEDUP_THRESHOLD
+            )
+            variants = {index: base for index, base in variants.items() if index in rows_to_process.index}
+        print(f"Найдено вариантов товаров: {len(variants)} (групп: {len(set(variants.values()))})")
+    
+    base_rows = rows_to_process.drop(index=list(variants))
+    with stage('llm', rows=len(base_rows)):
+        generate(base_rows)
+    
+    if variants:
+        with stage('derive', rows=len(variants)):
+            derived = derive_variants(catalog_df, variants, empty_mask)
+            for index, field, content in derived:
+                journal.append(artikuls[index], field, content, input_hashes[index])
+        processed += len(derived)
+        print(f"Заполнено подстановкой из базовых товаров: {len(derived)} полей")
         
-        if updated_fields:
-            print(f"  Обновлено: {', '.join(updated_fields)}")
-        
-        # Промежуточное сохранение каждые 10 товаров
-        if (index + 1) % 10 == 0:
-            catalog_df.to_csv('catalog6_ai_filled.csv', sep=';', index=False, encoding='utf-8-sig')
-            print(f"  Промежуточное сохранение ({index + 1} товаров)")
+        # Поля, которые не удалось перенести, генерируются как обычно
+        variant_rows = catalog_df.loc[list(variants)]
+        variant_empty = variant_rows[empty_fields].isna() | (variant_rows[empty_fields] == '')
+        remaining = variant_rows[variant_empty.any(axis=1)]
+        if len(remaining):
+            with stage('llm_variants', rows=len(remaining)):
+                generate(remaining)
+    
+    journal.close()
+    
+    # Финальное сохранение (прогресс при сбое сохраняется в журнале)
+    with stage('save', rows=len(catalog_df)):
+        write_table(catalog_df, output_path)
+        save_input_hashes(catalog_df, input_hashes, known_hashes)
+    if ai_generator.cache:
+        print(ai_generator.cache.stats())
+    print(ai_generator.metrics.summary())
+    ai_generator.close()
+    print(f"\nГотово! Обработано {processed} полей. Результат сохранен в {output_path}")
     
-    # Финальное сохранение
-    catalog_df.to_csv('catalog6_ai_filled.csv', sep=';', index=False, encoding='utf-8-sig')
-    print(f"\nГотово! Обработано {processed} полей. Результат сохранен в catalog6_ai_filled.csv")
+    # Ненулевой код выхода: pipeline.py не должен считать каталог с пустыми полями актуальным
+    if failed:
+        print(f"Не удалось сгенерировать {failed} полей, они будут сгенерированы при следующем запуске")
+        sys.exit(1)
 
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with stage('full_catalog_with_ai'):
+        main()
\ No newline at end of file
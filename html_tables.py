@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import lxml.html
+from lxml import etree
+
+from atomic_file import atomic_write
+
+def _cell_text(cell) -> str:
+    """Текст ячейки как у BeautifulSoup get_text(strip=True)"""
+    return ''.join(text.strip() for text in cell.xpath('.//text()'))
+
+def extract_table_rows(html: str) -> List[List[str]]:
+    """
+    Извлекает первые две ячейки каждой строки первой таблицы из HTML
+
+    Returns:
+        Список пар [название, значение] (строки с менее чем двумя ячейками пропускаются)
+    """
+    if not html or not html.strip():
+        return []
+
+    try:
+        root = lxml.html.fragment_fromstring(html, create_parent='div')
+    except (etree.ParserError, ValueError):
+        return []
+
+    table = next(root.iter('table'), None)
+    if table is None:
+        return []
+
+    rows = []
+    for row in table.iter('tr'):
+        cells = list(row.iter('td', 'th'))
+        if len(cells) >= 2:
+            rows.append([_cell_text(cells[0]), _cell_text(cells[1])])
+
+    return rows
+
+class TableParseCache:
+    """
+    Кэш разобранных HTML таблиц между запусками (ключ - хэш HTML)
+
+    При сохранении остаются только записи, использованные в текущем запуске,
+    поэтому кэш не растет больше фида.
+    """
+
+    def __init__(self, path: Optional[str] = 'html_tables_cache.json'):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, List[List[str]]] = {}
+        self._used: Dict[str, List[List[str]]] = {}
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    self._entries = json.load(file)
+            except ValueError:
+                self._entries = {}
+
+    def rows(self, html: str) -> List[List[str]]:
+        """Строки таблицы из кэша или после разбора"""
+        if not html:
+            return []
+
+        key = hashlib.sha1(html.encode('utf-8')).hexdigest()
+        rows = self._used.get(key)
+        if rows is None:
+            rows = self._entries.get(key)
+            if rows is None:
+                self.misses += 1
+                rows = extract_table_rows(html)
+            else:
+                self.hits += 1
+            self._used[key] = rows
+
+        return rows
+
+    def save(self):
+        """Сохраняет использованные записи"""
+        if not self.path:
+            return
+        with atomic_write(self.path, 'w', encoding='utf-8') as file:
+            json.dump(self._used, file, ensure_ascii=False)
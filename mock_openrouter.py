@@ -0,0 +1,166 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Ключи JSON из промпта комбинированной генерации: - "title": ...
+JSON_KEY = re.compile(r'-\s*"(\w+)":')
+
+# Товары пакетного запроса характеристик: - vendorCode: название
+BATCH_PRODUCT = re.compile(r'^\s*-\s*([^:\s]+):\s*(.+)$', re.MULTILINE)
+
+def fake_table(name: str) -> str:
+    """HTML таблица характеристик"""
+    rows = ''.join(f"<tr><td>Параметр {number}</td><td>{len(name) + number}</td></tr>" for number in range(8))
+    return f"<table><tbody>{rows}</tbody></table>"
+
+def fake_completion(prompt: str) -> str:
+    """Ответ модели: JSON с запрошенными ключами, HTML таблица или текст с названием товара"""
+    name = re.search(r'Название:\s*(.+)', prompt)
+    name = name.group(1).strip() if name else 'товар'
+
+    if 'vendorCode' in prompt and 'JSON' in prompt:
+        products = BATCH_PRODUCT.findall(prompt.split('Требования:')[0])
+        return json.dumps({code: fake_table(product) for code, product in products}, ensure_ascii=False)
+
+    keys = JSON_KEY.findall(prompt)
+    if keys and 'JSON' in prompt:
+        return json.dumps({key: f"{key} для {name}" for key in keys}, ensure_ascii=False)
+
+    if 'HTML таблиц' in prompt:
+        return fake_table(name)
+    return f"Сгенерированный текст для {name}. Надежное оборудование по выгодной цене."
+
+class MockOpenRouterServer:
+    """
+    Локальная замена OpenRouter chat/completions для бенчмарков без сети
+
+    Отвечает с заданной задержкой; часть запросов завершается ошибкой 500,
+    а каждые burst_every запросов следующие burst_length получают 429
+    с заголовком Retry-After.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.05,
+                 error_rate: float = 0.0, burst_every: int = 0, burst_length: int = 0,
+                 retry_after: float = 1.0, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def _next_outcome(self) -> int:
+        """HTTP статус для очередного запроса"""
+        with self._lock:
+            self.requests += 1
+            if self.burst_every and self.burst_length and self.requests % self.burst_every < self.burst_length:
+                self.throttled += 1
+                return 429
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return 500
+            return 200
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b'', headers: dict = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+
+                status = server._next_outcome()
+                if status == 429:
+                    self._send(429, headers={'Retry-After': str(server.retry_after)})
+                    return
+
+                time.sleep(server.latency)
+                if status != 200:
+                    self._send(status)
+                    return
+
+                messages = request.get('messages') or [{}]
+                prompt = messages[-1].get('content', '')
+                content = fake_completion(prompt)
+                prompt_tokens = sum(len(message.get('content', '')) for message in messages) // 3
+                completion_tokens = len(content) // 3
+                body = json.dumps({
+                    'id': f"mock-{server.requests}",
+                    'model': request.get('model'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': completion_tokens,
+                        'total_tokens': prompt_tokens + completion_tokens
+                    }
+                }, ensure_ascii=False).encode('utf-8')
+                self._send(200, body, {'Content-Type': 'application/json'})
+
+        return Handler
+
+    def start(self) -> 'MockOpenRouterServer':
+        """Запускает сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'MockOpenRouterServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер, имитирующий OpenRouter chat/completions")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа в секундах")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--burst-every', type=int, default=0, help="период серий ответов 429 (в запросах)")
+    parser.add_argument('--burst-length', type=int, default=0, help="длина серии ответов 429")
+    args = parser.parse_args()
+
+    server = MockOpenRouterServer(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                                  burst_every=args.burst_every, burst_length=args.burst_length)
+    print(f"Mock OpenRouter: {server.url} (укажите его в API_URL)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
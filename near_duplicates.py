@@ -0,0 +1,170 @@
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Токен названия: слово или модель вида PF-200, 1.5, 220В
+TOKEN = re.compile(r'[0-9a-zа-яё]+(?:[-./][0-9a-zа-яё]+)*', re.IGNORECASE)
+NUMBER = re.compile(r'\d+')
+# Пробелы внутри чисел ("150 000") при проверке остатков базового товара
+DIGIT_SPACE = re.compile(r'(?<=\d)[\s ](?=\d)')
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+def tokenize(name: str) -> List[str]:
+    """Токены названия в исходном регистре"""
+    return TOKEN.findall(name or '')
+
+def is_variable(token: str) -> bool:
+    """Токены с цифрами (модель, размер, напряжение) отличают варианты одной серии"""
+    return any(char.isdigit() for char in token)
+
+def mask(token: str) -> str:
+    """Токен с замаскированными числами: 'PF-200' -> 'pf-#'"""
+    return NUMBER.sub('#', token.lower())
+
+def template(tokens: List[str]) -> str:
+    """Название с замаскированными числами: 'Станок PF-200 220В' -> 'станок pf-# #в'"""
+    return ' '.join(mask(token) for token in tokens)
+
+def shingles(text: str, size: int = 3) -> set:
+    """Символьные шинглы строки"""
+    text = f" {text} "
+    return {text[start:start + size] for start in range(max(1, len(text) - size + 1))}
+
+def minhash(shingle_set: set) -> np.ndarray:
+    """MinHash подпись множества шинглов"""
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set], dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+def aligned(base: List[str], variant: List[str]) -> bool:
+    """Названия отличаются только числами внутри токенов на тех же позициях"""
+    return len(base) == len(variant) and all(mask(b) == mask(v) for b, v in zip(base, variant))
+
+def find_variant_groups(items: Iterable[Tuple[Hashable, str, str]], threshold: float = 0.8) -> Dict[Hashable, Hashable]:
+    """
+    Находит варианты одного товара внутри категории (без сети)
+
+    Кандидаты ищутся через MinHash + LSH по шинглам названий с замаскированными
+    числами, затем проверяются точным коэффициентом Жаккара и совпадением
+    токенов (отличаться могут только числа: размер, модель, напряжение).
+
+    Args:
+        items: Тройки (ключ, название, категория)
+        threshold: Минимальное сходство шинглов
+
+    Returns:
+        Словарь ключ варианта -> ключ базового товара группы (первого в группе)
+    """
+    entries = []
+    buckets = {}
+    rows_per_band = NUM_PERMUTATIONS // BANDS
+
+    for key, name, category in items:
+        tokens = tokenize(name)
+        if not any(is_variable(token) for token in tokens):
+            continue
+        shingle_set = shingles(template(tokens))
+        signature = minhash(shingle_set)
+        number = len(entries)
+        entries.append((key, tokens, shingle_set))
+        for band in range(BANDS):
+            band_key = (category, band, signature[band * rows_per_band:(band + 1) * rows_per_band].tobytes())
+            buckets.setdefault(band_key, []).append(number)
+
+    # Объединяем кандидатов из общих корзин LSH (система непересекающихся множеств)
+    parent = list(range(len(entries)))
+
+    def find(number: int) -> int:
+        while parent[number] != number:
+            parent[number] = parent[parent[number]]
+            number = parent[number]
+        return number
+
+    for members in buckets.values():
+        first = members[0]
+        for other in members[1:]:
+            root_first, root_other = find(first), find(other)
+            if root_first == root_other:
+                continue
+            first_shingles, other_shingles = entries[first][2], entries[other][2]
+            similarity = len(first_shingles & other_shingles) / len(first_shingles | other_shingles)
+            if similarity >= threshold:
+                parent[max(root_first, root_other)] = min(root_first, root_other)
+
+    variants = {}
+    for number, (key, tokens, _) in enumerate(entries):
+        root = find(number)
+        if root != number and aligned(entries[root][1], tokens):
+            variants[key] = entries[root][0]
+    return variants
+
+def substitution_map(base_name: str, variant_name: str) -> Optional[Dict[str, str]]:
+    """
+    Замены для переноса текста с базового товара на вариант: только целые
+    токены названия, которые различаются (PF-200 -> PF-300, 220В -> 380В)
+
+    Returns:
+        Словарь (в нижнем регистре) токен базового товара -> токен варианта или None,
+        если названия не совпадают по структуре или замены противоречат друг другу
+    """
+    base_tokens, variant_tokens = tokenize(base_name), tokenize(variant_name)
+    if not aligned(base_tokens, variant_tokens):
+        return None
+
+    mapping = {}
+    for base, variant in zip(base_tokens, variant_tokens):
+        if base.lower() == variant.lower():
+            continue
+        if mapping.get(base.lower(), variant) != variant:
+            return None
+        mapping[base.lower()] = variant
+    return mapping
+
+def base_numbers(base_name: str, variant_name: str) -> set:
+    """Числа из токенов базового товара, которых нет в соответствующих токенах варианта"""
+    numbers = set()
+    for base, variant in zip(tokenize(base_name), tokenize(variant_name)):
+        numbers.update(set(NUMBER.findall(base)) - set(NUMBER.findall(variant)))
+    return numbers
+
+def derive_variant_text(text: str, base_name: str, variant_name: str, base_price: str = '', variant_price: str = '') -> Optional[str]:
+    """
+    Переносит сгенерированный текст базового товара на вариант подстановкой токенов
+
+    Заменяются только целые токены названия; отдельные числа ("шириной 200 мм")
+    не трогаются - это могут быть характеристики, а не номер модели.
+
+    Returns:
+        Текст для варианта или None, если подстановка небезопасна (в тексте остались
+        числа из названия или цена базового товара) - тогда вариант генерируется отдельно
+    """
+    mapping = substitution_map(base_name, variant_name)
+    if mapping is None:
+        return None
+
+    if mapping:
+        # Одна замена за проход: замененные значения не заменяются повторно
+        keys = sorted(mapping, key=len, reverse=True)
+        pattern = re.compile('|'.join(
+            rf'(?<![0-9a-zа-яё]){re.escape(key)}(?![0-9a-zа-яё]|[-./][0-9a-zа-яё])' for key in keys
+        ), re.IGNORECASE)
+        text = pattern.sub(lambda match: mapping[match.group(0).lower()], text)
+
+    # Проверяем, что в тексте не осталось значений, специфичных для базового товара
+    leftovers = base_numbers(base_name, variant_name)
+    base_price_digits = NUMBER.findall(base_price)[:1]
+    if base_price_digits and NUMBER.findall(variant_price)[:1] != base_price_digits:
+        leftovers.update(base_price_digits)
+
+    normalized = DIGIT_SPACE.sub('', text)
+    if any(re.search(rf'(?<!\d){re.escape(value)}(?!\d)', normalized) for value in leftovers):
+        return None
+    return text
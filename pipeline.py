@@ -0,0 +1,254 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Set
+
+from atomic_file import atomic_write
+from catalog_io import find_stage
+
+STATE_PATH = '.pipeline_state.json'
+
+# Скрипты этапов лежат рядом с pipeline.py, данные - в текущей папке
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Настройки .env, влияющие на результат любого этапа
+SHARED_SETTINGS = ['CATALOG_FORMAT']
+
+# Этапы в порядке выполнения. Файлы без расширения - промежуточные таблицы
+# (CSV или Parquet в зависимости от CATALOG_FORMAT); settings - настройки .env,
+# при изменении которых этап выполняется заново
+STAGES = [
+    {
+        'name': 'excel_to_csv',
+        'script': 'excel_to_csv.py',
+        'inputs': ['PROMA_VISPROM_Прайс_лист_с_15_09_2025_курс_86.xlsx'],
+        'outputs': ['price_new']
+    },
+    {
+        'name': 'update_catalog',
+        'script': 'update_catalog.py',
+        'inputs': ['price_new', 'catalog6.csv'],
+        'outputs': ['catalog6_new', 'catalog6_changes.csv']
+    },
+    {
+        'name': 'add_descriptions_to_xml',
+        'script': 'add_descriptions_to_xml.py',
+        'inputs': ['catalog6_new', 'feed-yml-0.xml'],
+        'outputs': ['feed-yml-0.xml'],
+        'settings': ['MODEL', 'AI_TECH_BATCH']
+    },
+    {
+        'name': 'final_update_catalog_format_description',
+        'script': 'final_update_catalog_format_description.py',
+        'inputs': ['catalog6_new', 'feed-yml-0.xml'],
+        'outputs': ['catalog6_formatted']
+    },
+    {
+        'name': 'full_catalog_with_ai',
+        'script': 'full_catalog_with_ai.py',
+        'inputs': ['catalog6_formatted'],
+        'outputs': ['catalog6_ai_filled'],
+        'settings': ['MODEL', 'AI_COMBINED', 'AI_DEDUP', 'AI_DEDUP_THRESHOLD']
+    },
+    {
+        'name': 'clean_ai_content',
+        'script': 'clean_ai_content.py',
+        'inputs': ['catalog6_ai_filled'],
+        'outputs': ['catalog6_ai_cleaned.csv']
+    }
+]
+
+def resolve_path(name: str) -> str:
+    """Путь к файлу этапа: промежуточные таблицы ищутся в CSV и Parquet"""
+    return find_stage(name) if not os.path.splitext(name)[1] else name
+
+def stage_dependencies(stages: List[Dict]) -> Dict[str, List[str]]:
+    """Строит граф зависимостей: этап -> этапы, которые создают его входы"""
+    producers = {}
+    dependencies = {}
+    for stage in stages:
+        dependencies[stage['name']] = sorted({
+            producers[name] for name in stage['inputs'] if name in producers and producers[name] != stage['name']
+        })
+        for name in stage['outputs']:
+            producers[name] = stage['name']
+    return dependencies
+
+class FingerprintCache:
+    """Хэши файлов; повторно файл хэшируется только если изменились размер или время модификации"""
+
+    def __init__(self, known: Dict[str, Dict]):
+        self.known = known
+
+    def fingerprint(self, path: str) -> Dict:
+        if not os.path.exists(path):
+            return {'missing': True}
+
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known and known.get('mtime_ns') == stat.st_mtime_ns and known.get('size') == stat.st_size:
+            return known
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        fingerprint = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest.hexdigest()}
+        self.known[path] = fingerprint
+        return fingerprint
+
+def local_modules(script: str) -> Set[str]:
+    """Скрипт и все модули проекта, которые он импортирует (в том числе косвенно)"""
+    modules = set()
+    queue = [script]
+    while queue:
+        name = queue.pop()
+        path = os.path.join(SCRIPTS_DIR, name)
+        if name in modules or not os.path.exists(path):
+            continue
+        modules.add(name)
+
+        with open(path, encoding='utf-8') as file:
+            tree = ast.parse(file.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                queue.extend(alias.name.split('.')[0] + '.py' for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                queue.append(node.module.split('.')[0] + '.py')
+    return modules
+
+def stage_inputs_fingerprint(stage: Dict, cache: FingerprintCache) -> Dict[str, str]:
+    """
+    Хэши входов этапа
+
+    Кроме файлов данных учитываются код (скрипт и общие модули проекта, например
+    промпты в ai_content_generator.py) и настройки .env, чтобы их изменение
+    тоже вызывало пересборку.
+    """
+    fingerprints = {}
+    for module in sorted(local_modules(stage['script'])):
+        fingerprints[module] = cache.fingerprint(os.path.join(SCRIPTS_DIR, module)).get('sha256', 'missing')
+    for setting in SHARED_SETTINGS + stage.get('settings', []):
+        fingerprints[f"${setting}"] = os.getenv(setting, '')
+    for name in stage['inputs']:
+        fingerprint = cache.fingerprint(resolve_path(name))
+        fingerprints[name] = fingerprint.get('sha256', 'missing')
+    return fingerprints
+
+def stale_reason(stage: Dict, state: Dict, cache: FingerprintCache) -> str:
+    """Причина, по которой этап нужно выполнить, или '' если он актуален"""
+    missing_outputs = [name for name in stage['outputs'] if not os.path.exists(resolve_path(name))]
+    if missing_outputs:
+        return f"нет результата: {', '.join(missing_outputs)}"
+
+    recorded = state['stages'].get(stage['name'])
+    if recorded is None:
+        return "еще не выполнялся"
+
+    current = stage_inputs_fingerprint(stage, cache)
+    changed = [name for name, digest in current.items() if recorded.get(name) != digest]
+    if changed:
+        return f"изменились: {', '.join(changed)}"
+
+    return ""
+
+def load_state() -> Dict:
+    if os.path.exists(STATE_PATH):
+        try:
+            with open(STATE_PATH, encoding='utf-8') as file:
+                state = json.load(file)
+            state.setdefault('stages', {})
+            state.setdefault('files', {})
+            return state
+        except ValueError:
+            pass
+    return {'stages': {}, 'files': {}}
+
+def save_state(state: Dict):
+    with atomic_write(STATE_PATH, 'w', encoding='utf-8') as file:
+        json.dump(state, file, ensure_ascii=False, indent=2)
+
+def run_pipeline(until: str = None, force: List[str] = None, dry_run: bool = False) -> bool:
+    """
+    Выполняет устаревшие этапы по порядку, актуальные пропускает
+
+    Args:
+        until: Последний выполняемый этап (по умолчанию все)
+        force: Этапы, которые нужно выполнить независимо от состояния ('all' - все)
+        dry_run: Только показать, какие этапы будут выполнены
+
+    Returns:
+        True, если все выбранные этапы актуальны или выполнены успешно
+    """
+    force = force or []
+    state = load_state()
+    cache = FingerprintCache(state['files'])
+    dependencies = stage_dependencies(STAGES)
+    rebuilt = set()
+
+    # Скрипты запускаются без вопросов пользователю
+    env = dict(os.environ, ASSUME_YES='1')
+
+    for stage in STAGES:
+        name = stage['name']
+
+        reason = stale_reason(stage, state, cache)
+        if not reason and ('all' in force or name in force):
+            reason = "принудительный запуск"
+
+        upstream = sorted(rebuilt.intersection(dependencies[name]))
+        if not reason and dry_run and upstream:
+            print(f"[{name}] будет выполнен, если изменятся результаты: {', '.join(upstream)}")
+            rebuilt.add(name)
+        elif not reason:
+            print(f"[{name}] актуален, пропускаю")
+        elif dry_run:
+            print(f"[{name}] будет выполнен ({reason})")
+            rebuilt.add(name)
+        else:
+            print(f"[{name}] выполняю ({reason})")
+            result = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, stage['script'])], env=env)
+            if result.returncode != 0:
+                print(f"[{name}] завершился с ошибкой (код {result.returncode}), конвейер остановлен")
+                save_state(state)
+                return False
+
+            missing_outputs = [output for output in stage['outputs'] if not os.path.exists(resolve_path(output))]
+            if missing_outputs:
+                print(f"[{name}] не создал {', '.join(missing_outputs)}, конвейер остановлен")
+                save_state(state)
+                return False
+
+            # Входы фиксируются после выполнения: этап может изменять свой вход (feed-yml-0.xml)
+            state['stages'][name] = stage_inputs_fingerprint(stage, cache)
+            save_state(state)
+            rebuilt.add(name)
+
+        if name == until:
+            break
+
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Запускает этапы обработки каталога по порядку, пропуская этапы с неизменными входами"
+    )
+    parser.add_argument('--until', choices=[stage['name'] for stage in STAGES],
+                        help="последний выполняемый этап")
+    parser.add_argument('--force', nargs='*', metavar='STAGE',
+                        help="выполнить указанные этапы (без аргументов - все) независимо от состояния")
+    parser.add_argument('--dry-run', action='store_true', help="только показать план")
+    args = parser.parse_args()
+
+    # --force без аргументов - все этапы
+    force = None if args.force is None else (args.force or ['all'])
+    ok = run_pipeline(until=args.until, force=force, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
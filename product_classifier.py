@@ -0,0 +1,44 @@
+import functools
+import re
+
+import pandas as pd
+
+# Основы ключевых слов технических товаров: совпадают с разными формами слова
+# (станок/станка/станки, сверло/сверла/свёрла, полотно/полотен). Это шире
+# прежнего списка слов: например, 'фрез' находит и "фрезерный", 'машин' -
+# "машинка", поэтому tech генерируется для большего числа товаров
+TECHNICAL_NAME_STEMS = [
+    r'стан[о]?к', r'двигател', r'мотор', r'привод', r'шпиндел', r'патрон',
+    r'фрез', r'св[её]рл', r'рез[е]?ц', r'диск', r'круг', r'полот[е]?н',
+    r'насос', r'компрессор', r'генератор', r'трансформатор',
+    r'редуктор', r'короб[о]?к', r'механизм', r'устройств',
+    r'прибор', r'инструмент', r'оборудовани', r'машин'
+]
+
+# Основы слов в категории, по которым товар считается техническим
+TECHNICAL_CATEGORY_STEMS = [r'стан[о]?к', r'оборудовани', r'инструмент', r'механизм']
+
+# Слова в строках-заголовках прайса, которые обозначают категорию
+CATEGORY_HEADER_KEYWORDS = ['Фрезерные', 'Строгальные', 'Рейсмусовые', 'Комбинированные', 'Шлифовальные', 'Подложка', 'Пылесосы', 'Подставки']
+
+TECHNICAL_NAME_PATTERN = re.compile('|'.join(TECHNICAL_NAME_STEMS))
+TECHNICAL_CATEGORY_PATTERN = re.compile('|'.join(TECHNICAL_CATEGORY_STEMS))
+CATEGORY_HEADER_PATTERN = re.compile(
+    '|'.join(['станки', 'пилы'] + [re.escape(keyword.lower()) for keyword in CATEGORY_HEADER_KEYWORDS])
+)
+
+@functools.lru_cache(maxsize=None)
+def is_technical_category(category: str) -> bool:
+    """Категория технических товаров (результат запоминается: категорий мало, товаров много)"""
+    return bool(TECHNICAL_CATEGORY_PATTERN.search(category.lower()))
+
+def classify_technical(names: pd.Series, categories: pd.Series) -> pd.Series:
+    """Классифицирует столбцы названий и категорий одним вызовом (True - технический товар)"""
+    by_name = names.fillna('').astype(str).str.lower().str.contains(TECHNICAL_NAME_PATTERN)
+    categories = categories.fillna('').astype(str)
+    by_category = categories.map({category: is_technical_category(category) for category in categories.unique()})
+    return by_name | by_category.astype(bool)
+
+def is_category_header(names: pd.Series) -> pd.Series:
+    """Строки прайса, название которых обозначает категорию товаров"""
+    return names.fillna('').astype(str).str.lower().str.contains(CATEGORY_HEADER_PATTERN)
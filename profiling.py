@@ -0,0 +1,93 @@
+import contextvars
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:
+    # На Windows модуля resource нет - пиковая память не измеряется
+    resource = None
+
+# Загружаем переменные окружения
+load_dotenv()
+
+# Имя текущего этапа: вложенные этапы получают имена вида "этап/шаг"
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+_log_lock = threading.Lock()
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый объем памяти процесса в МБ (ru_maxrss: КБ в Linux, байты в macOS)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _write_record(record: Dict):
+    """Дописывает запись этапа в PROFILE_LOG (если задан)"""
+    path = os.getenv('PROFILE_LOG')
+    if not path:
+        return
+    with _log_lock, open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Замеряет этап: время, процессорное время, пиковую память и количество строк
+
+    Количество строк можно указать сразу или записать в record['rows'] внутри блока.
+    При PROFILE_DIR этап дополнительно выполняется под cProfile, результат
+    сохраняется в PROFILE_DIR/<этап>.prof (смотреть через snakeviz или pstats).
+
+    Пример:
+        with stage('xml_parse') as record:
+            record['rows'] = parse()
+    """
+    parent = _current_stage.get()
+    full_name = f"{parent}/{name}" if parent else name
+    token = _current_stage.set(full_name)
+    record = {'stage': full_name, 'rows': rows}
+
+    profile_dir = os.getenv('PROFILE_DIR')
+    # Вложенные этапы уже попадают в профиль внешнего
+    profiler = cProfile.Profile() if profile_dir and parent is None else None
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+        _current_stage.reset(token)
+
+        record.update(
+            timestamp=round(time.time(), 3),
+            wall=round(time.perf_counter() - wall_start, 4),
+            cpu=round(time.process_time() - cpu_start, 4),
+            peak_rss_mb=peak_rss_mb()
+        )
+
+        details = f"{record['wall']:.3f} с, CPU {record['cpu']:.3f} с"
+        if record['peak_rss_mb'] is not None:
+            details += f", пик памяти {record['peak_rss_mb']} МБ"
+        if record['rows'] is not None:
+            details += f", {record['rows']} строк"
+        print(f"[этап {full_name}] {details}")
+        _write_record(record)
+
+        if profiler:
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, full_name.replace('/', '_') + '.prof')
+            profiler.dump_stats(profile_path)
+            print(f"[этап {full_name}] профиль сохранен в {profile_path}")
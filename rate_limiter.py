@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+class RateLimiter:
+    """
+    Общий ограничитель частоты запросов к API
+
+    Держит два бюджета (запросы в секунду и токены в минуту) и подстраивает темп
+    под ответы провайдера: после 429 скорость снижается вдвое, после успешных
+    запросов постепенно возвращается к максимальной.
+    """
+
+    def __init__(self, requests_per_second: float = 2.0, tokens_per_minute: Optional[int] = None,
+                 min_requests_per_second: float = 0.1):
+        """
+        Args:
+            requests_per_second: Максимальное количество запросов в секунду
+            tokens_per_minute: Максимальное количество токенов в минуту (None - без ограничения)
+            min_requests_per_second: Нижняя граница скорости при частых 429
+        """
+        if requests_per_second <= 0:
+            raise ValueError("Количество запросов в секунду должно быть больше 0")
+
+        self.max_rate = requests_per_second
+        self.min_rate = min(min_requests_per_second, requests_per_second)
+        self.rate = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+
+        self.throttled = 0  # Количество полученных 429
+        self.succeeded = 0
+
+        self._lock = threading.Lock()
+        self._request_allowance = 1.0
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        """Пополняет бюджеты пропорционально прошедшему времени"""
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(max(1.0, self.rate), self._request_allowance + elapsed * self.rate)
+        if self.tokens_per_minute:
+            self._token_allowance = min(float(self.tokens_per_minute),
+                                        self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Ждет, пока бюджеты позволят выполнить запрос, и списывает их
+
+        Args:
+            tokens: Ожидаемое количество токенов запроса
+
+        Returns:
+            Время ожидания в секундах
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait_time = max(0.0, self._blocked_until - now)
+                if self._request_allowance < 1:
+                    wait_time = max(wait_time, (1 - self._request_allowance) / self.rate)
+                if self.tokens_per_minute and self._token_allowance < tokens:
+                    wait_time = max(wait_time, (tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+
+                if wait_time <= 0:
+                    self._request_allowance -= 1
+                    if self.tokens_per_minute:
+                        self._token_allowance -= tokens
+                    return now - started
+
+            time.sleep(wait_time)
+
+    def record_tokens(self, tokens: int):
+        """Корректирует бюджет токенов по фактическому расходу (разница с оценкой)"""
+        if not self.tokens_per_minute or not tokens:
+            return
+        with self._lock:
+            self._token_allowance -= tokens
+
+    def on_success(self):
+        """Плавно увеличивает скорость после успешного запроса"""
+        with self._lock:
+            self.succeeded += 1
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """
+        Снижает скорость после ответа 429 и приостанавливает все запросы
+
+        Args:
+            retry_after: Пауза из заголовка Retry-After в секундах
+        """
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._request_allowance = min(self._request_allowance, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 0)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
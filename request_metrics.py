@@ -0,0 +1,166 @@
+import contextvars
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from atomic_file import atomic_write
+
+# Поле и товар текущего запроса: задаются вокруг генерации и попадают в метрики
+current_field = contextvars.ContextVar('current_field', default=None)
+current_sku = contextvars.ContextVar('current_sku', default=None)
+# Время постановки задачи в очередь пула (учитывается один раз - в первом запросе задачи)
+queued_at = contextvars.ContextVar('queued_at', default=None)
+
+@contextmanager
+def request_context(field: Optional[str] = None, sku: Optional[str] = None, queued: Optional[float] = None):
+    """Помечает запросы внутри блока полем и артикулом товара"""
+    tokens = [(current_field, current_field.set(field)), (current_sku, current_sku.set(sku))]
+    if queued is not None:
+        tokens.append((queued_at, queued_at.set(queued)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def take_queue_wait(now: float) -> float:
+    """Время ожидания задачи в пуле потоков (возвращается только первому запросу задачи)"""
+    queued = queued_at.get()
+    if queued is None:
+        return 0.0
+    queued_at.set(None)
+    return max(0.0, now - queued)
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+class RequestMetrics:
+    """
+    Метрики запросов к API: задержка, ожидание в очереди, повторы, токены, кэш
+
+    Каждая запись сразу дописывается в JSONL файл; если путь оканчивается на
+    .prom, при закрытии записывается снимок в текстовом формате Prometheus
+    (для node_exporter textfile collector). Записи также хранятся в памяти
+    для итоговой сводки.
+    """
+
+    def __init__(self, path: Optional[str] = None, prompt_price: float = 0.0, completion_price: float = 0.0):
+        """
+        Args:
+            path: Файл метрик (.jsonl или .prom; None - только сводка)
+            prompt_price: Цена 1M входных токенов в USD
+            completion_price: Цена 1M выходных токенов в USD
+        """
+        self.path = path
+        self.prometheus = bool(path) and path.endswith('.prom')
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.records: List[Dict] = []
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, **values):
+        """Добавляет запись о запросе (поле и артикул берутся из request_context)"""
+        record = {
+            'timestamp': round(time.time(), 3),
+            'field': current_field.get(),
+            'sku': current_sku.get(),
+            **values
+        }
+        record['cost'] = self.cost(record.get('prompt_tokens', 0), record.get('completion_tokens', 0))
+
+        with self._lock:
+            self.records.append(record)
+            if self.path and not self.prometheus:
+                if self._file is None:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1_000_000
+
+    def by_field(self) -> Dict[str, Dict]:
+        """Сводные показатели по каждому полю"""
+        with self._lock:
+            records = list(self.records)
+
+        elapsed = max(time.time() - self.started, 1e-9)
+        groups = {}
+        for record in records:
+            groups.setdefault(record['field'] or 'прочее', []).append(record)
+
+        summary = {}
+        for field, items in sorted(groups.items()):
+            # Задержка считается только по запросам, дошедшим до API
+            latencies = [item['latency'] for item in items if not item.get('cache_hit')]
+            summary[field] = {
+                'requests': len(items),
+                'cache_hits': sum(1 for item in items if item.get('cache_hit')),
+                'failed': sum(1 for item in items if item.get('status') != 'ok'),
+                'retries': sum(item.get('retries', 0) for item in items),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'queue_wait_p95': percentile([item.get('queue_wait', 0.0) for item in items], 95),
+                'throughput': len(items) / elapsed,
+                'prompt_tokens': sum(item.get('prompt_tokens', 0) for item in items),
+                'completion_tokens': sum(item.get('completion_tokens', 0) for item in items),
+                'cost': sum(item.get('cost', 0.0) for item in items)
+            }
+        return summary
+
+    def summary(self) -> str:
+        """Итоговая сводка запуска по полям"""
+        summary = self.by_field()
+        if not summary:
+            return "Метрики API: запросов не было"
+
+        lines = ["Метрики API по полям:"]
+        for field, stats in summary.items():
+            line = (f"  {field}: {stats['requests']} запросов (кэш {stats['cache_hits']}, ошибок {stats['failed']}, "
+                    f"повторов {stats['retries']}), p50 {stats['p50']:.2f} с, p95 {stats['p95']:.2f} с, "
+                    f"ожидание p95 {stats['queue_wait_p95']:.2f} с, {stats['throughput']:.2f} запр/с, токены {stats['prompt_tokens']}+{stats['completion_tokens']}")
+            if self.prompt_price or self.completion_price:
+                line += f", ${stats['cost']:.4f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def write_prometheus(self):
+        """Записывает снимок метрик в текстовом формате Prometheus"""
+        summary = self.by_field()
+        metrics = [
+            ('ai_requests_total', 'counter', 'Запросы к API', lambda stats: [('', stats['requests'])]),
+            ('ai_cache_hits_total', 'counter', 'Ответы из кэша', lambda stats: [('', stats['cache_hits'])]),
+            ('ai_failed_requests_total', 'counter', 'Запросы без результата', lambda stats: [('', stats['failed'])]),
+            ('ai_retries_total', 'counter', 'Повторы после 429 и 5xx', lambda stats: [('', stats['retries'])]),
+            ('ai_request_latency_seconds', 'summary', 'Задержка запроса',
+             lambda stats: [(',quantile="0.5"', stats['p50']), (',quantile="0.95"', stats['p95'])]),
+            ('ai_tokens_total', 'counter', 'Токены',
+             lambda stats: [(',kind="prompt"', stats['prompt_tokens']), (',kind="completion"', stats['completion_tokens'])]),
+            ('ai_cost_usd_total', 'counter', 'Стоимость в USD', lambda stats: [('', stats['cost'])])
+        ]
+
+        with atomic_write(self.path, 'w', encoding='utf-8') as file:
+            for name, kind, help_text, values in metrics:
+                file.write(f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n")
+                for field, stats in summary.items():
+                    label = field.replace('\\', '\\\\').replace('"', '\\"')
+                    for labels, value in values(stats):
+                        file.write(f'{name}{{field="{label}"{labels}}} {value}\n')
+
+    def close(self):
+        """Закрывает JSONL файл или записывает снимок Prometheus"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.prometheus:
+            self.write_prometheus()
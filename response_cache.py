@@ -0,0 +1,106 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+class ResponseCache:
+    """
+    Постоянный кэш ответов ИИ в SQLite
+
+    Ключ - хэш адреса API, модели, системного промпта, промпта, max_tokens и
+    temperature, поэтому одинаковые запросы при повторных запусках не
+    отправляются в API, а ответы разных API (например, mock) не смешиваются.
+    """
+
+    def __init__(self, path: str = 'ai_cache.sqlite', ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Args:
+            path: Путь к файлу базы SQLite
+            ttl: Время жизни записи в секундах (None - бессрочно)
+            max_entries: Максимальное количество записей, давно не использованные удаляются первыми
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(api_url: str, model: str, system_prompt: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        """Вычисляет ключ кэша для параметров запроса (ответы разных API, например mock, не смешиваются)"""
+        payload = json.dumps([api_url, model, system_prompt, prompt, max_tokens, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный ответ или None"""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT response, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._connection.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str):
+        """Сохраняет ответ и удаляет лишние записи при превышении max_entries"""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, response, now, now)
+            )
+            if self.max_entries is not None:
+                self._connection.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            self._connection.commit()
+
+    def purge_expired(self) -> int:
+        """Удаляет записи старше ttl, возвращает количество удаленных"""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            cursor = self._connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+            self._connection.commit()
+            return cursor.rowcount
+
+    def stats(self) -> str:
+        """Строка статистики попаданий для вывода в консоль"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        return f"Кэш ИИ: {self.hits} попаданий, {self.misses} промахов ({hit_rate:.0f}%)"
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._connection.close()
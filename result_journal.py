@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from atomic_file import atomic_write
+
+class ResultJournal:
+    """
+    Журнал готовых результатов в формате JSONL (только дозапись)
+
+    Каждая строка - один результат (ключ товара, поле, контент). Запись
+    выполняется сразу по готовности результата, поэтому после сбоя
+    повторный запуск восстанавливает все, что уже было получено.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self, input_hashes: Optional[Dict[str, str]] = None) -> Dict[Tuple[str, str], str]:
+        """
+        Читает журнал: (ключ, поле) -> контент, более поздние записи перекрывают ранние
+
+        Args:
+            input_hashes: Текущие хэши входных данных по ключу; записи, сделанные
+                для других входных данных, пропускаются (записи без хэша принимаются)
+        """
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    if input_hashes is not None and record.get('hash') not in (None, input_hashes.get(record['key'])):
+                        continue
+                    results[(record['key'], record['field'])] = record['content']
+                except (ValueError, KeyError, TypeError):
+                    # Последняя строка может быть оборвана при аварийном завершении
+                    continue
+
+        return results
+
+    def history(self) -> Dict[Tuple[str, str], Set[str]]:
+        """Все когда-либо записанные значения: (ключ, поле) -> множество контентов (для любых входных данных)"""
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    results.setdefault((record['key'], record['field']), set()).add(record['content'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+        return results
+
+    def append(self, key: str, field: str, content: str, input_hash: Optional[str] = None):
+        """Дописывает результат в журнал и сбрасывает его на диск"""
+        record = {'key': key, 'field': field, 'content': content}
+        if input_hash is not None:
+            record['hash'] = input_hash
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+                # Отделяем новую запись от оборванной строки после сбоя
+                if self._file.tell() > 0 and not _ends_with_newline(self.path):
+                    self._file.write('\n')
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def rewrite(self, results: Dict[Tuple[str, str], str]):
+        """Атомарно заменяет журнал указанными результатами (пустой словарь - удаляет журнал)"""
+        self.close()
+        if not results:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        with atomic_write(self.path, 'w', encoding='utf-8') as file:
+            for (key, field), content in results.items():
+                file.write(json.dumps({'key': key, 'field': field, 'content': content}, ensure_ascii=False) + '\n')
+
+    def close(self):
+        """Закрывает файл журнала"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def _ends_with_newline(path: str) -> bool:
+    """Проверяет, что файл заканчивается переводом строки"""
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
@@ -1,54 +1,149 @@
+import sys
 import pandas as pd
+from catalog_io import find_stage, read_table, stage_path, write_table
+from product_classifier import is_category_header
+from profiling import stage
 
-# Читаем price_new.csv
-price_df = pd.read_csv('price_new.csv')
+# Раздел каталога для листа прайса; для остальных листов раздел - название листа
+SHEET_SECTIONS = {'Деревообработка': 'Деревообрабатывающее оборудование'}
+DEFAULT_SECTION = 'Деревообрабатывающее оборудование'
 
-# Читаем catalog6.csv
-catalog_df = pd.read_csv('catalog6.csv', sep=';')
+def _text_column(series: pd.Series) -> pd.Series:
+    """Приводит столбец прайса к строкам без пробелов по краям ('' для пустых ячеек)"""
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip()
 
-# Создаем новые записи для catalog6
-new_records = []
-current_category = ''
+def _number_column(series: pd.Series) -> pd.Series:
+    """
+    Текстовый столбец с целыми числами без хвоста '.0'
+
+    Столбец с числами и пустыми ячейками pandas читает как float: артикул
+    25406130 превращается в '25406130.0' и не совпадает с артикулом каталога.
+    """
+    return _text_column(series).str.replace(r'\.0$', '', regex=True)
+
+def build_catalog_records(price_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Строит записи каталога из прайс-листа столбцовыми операциями
+
+    Строки без артикула считаются заголовками; заголовок с названием категории
+    задает категорию для всех следующих товаров до следующей категории
+    (в пределах листа, если прайс собран из нескольких листов). На листе
+    деревообработки заголовки категорий распознаются по ключевым словам; на
+    листах без настроенного раздела категорией считается любой непустой
+    заголовок, а товары до первого заголовка получают категорию с названием листа.
+    """
+    artikul = _number_column(price_df['Unnamed: 0'])
+    name = _text_column(price_df['Unnamed: 1'])
+    price = _number_column(price_df['Unnamed: 2'])
 
-for _, row in price_df.iterrows():
-    artikul = str(row['Unnamed: 0']).strip()
-    name = str(row['Unnamed: 1']).strip()
-    price = str(row['Unnamed: 2']).strip()
-    
     # Проверяем, является ли строка названием категории
-    if pd.isna(row['Unnamed: 0']) or artikul == '' or artikul == 'nan':
-        if name and name != 'nan' and 'станки' in name.lower() or 'пилы' in name.lower() or any(x in name for x in ['Фрезерные', 'Строгальные', 'Рейсмусовые', 'Комбинированные', 'Шлифовальные', 'Подложка', 'Пылесосы', 'Подставки']):
-            current_category = name
-        continue
-    
+    is_header = artikul.isin(['', 'nan'])
+    is_category = is_header & ~name.isin(['', 'nan']) & is_category_header(name)
+    if 'Лист' in price_df.columns:
+        sheet = _text_column(price_df['Лист'])
+        # Ключевые слова заголовков подобраны под деревообработку, на других листах их нет
+        other_sheet = ~sheet.isin(SHEET_SECTIONS.keys())
+        is_category |= other_sheet & is_header & ~name.isin(['', 'nan'])
+        current_category = name.where(is_category).groupby(sheet).ffill()
+        current_category = current_category.fillna(sheet.where(other_sheet)).fillna('')
+        section = sheet.map(SHEET_SECTIONS).fillna(sheet)
+    else:
+        sheet = pd.Series('', index=price_df.index)
+        current_category = name.where(is_category).ffill().fillna('')
+        section = pd.Series(DEFAULT_SECTION, index=price_df.index)
+
     # Проверяем, что артикул не пустой и цена числовая
-    if artikul and artikul != 'nan' and price and price != '0' and current_category:
-        category_path = f'Каталог >> Деревообрабатывающее оборудование >> {current_category}'
-        
-        product_name = f'Proma {name}'
-        
-        new_record = {
-            'Артикул': artikul,
-            'Артикул модификации': artikul,
-            'Наименование': product_name,
-            'Цена': f'{price},00',
-            'Категория: 1': category_path,
-            'Валюта': 'RUB',
-            'Производитель': 'PROMA',
-            'SEO H1': product_name,
-            'Количество': 10,
-            'Количество на складе: Основной': 10,
-            'Включен': '+'
-        }
-        new_records.append(new_record)
-
-# Добавляем новые записи к существующему каталогу
-if new_records:
-    new_df = pd.DataFrame(new_records)
-    updated_catalog = pd.concat([catalog_df, new_df], ignore_index=True)
-    
-    # Сохраняем обновленный каталог
-    updated_catalog.to_csv('catalog6_new.csv', sep=';', index=False, encoding='utf-8-sig')
-    print(f"Добавлено {len(new_records)} новых товаров в catalog6_new.csv")
-else:
-    print("Нет данных для добавления")
\ No newline at end of file
+    has_price = ~is_header & ~price.isin(['', '0'])
+    is_product = has_price & current_category.ne('')
+
+    # Товары до первого заголовка категории пропускаются - сообщаем, сколько их
+    for sheet_name, count in sheet[has_price & ~is_product].value_counts(sort=False).items():
+        where = f" на листе {sheet_name}" if sheet_name else ""
+        print(f"Пропущено {count} товаров{where}: нет заголовка категории перед ними")
+
+    artikul = artikul[is_product]
+    product_name = 'Proma ' + name[is_product]
+
+    return pd.DataFrame({
+        'Артикул': artikul,
+        'Артикул модификации': artikul,
+        'Наименование': product_name,
+        'Цена': price[is_product] + ',00',
+        'Категория: 1': 'Каталог >> ' + section[is_product] + ' >> ' + current_category[is_product],
+        'Валюта': 'RUB',
+        'Производитель': 'PROMA',
+        'SEO H1': product_name,
+        'Количество': 10,
+        'Количество на складе: Основной': 10,
+        'Включен': '+'
+    }).reset_index(drop=True)
+
+def merge_catalog(catalog_df: pd.DataFrame, new_df: pd.DataFrame):
+    """
+    Объединяет каталог с записями из прайса по Артикулу
+
+    Для существующих товаров обновляются цена и категория, добавляются только
+    новые артикулы. Товары, которых нет в прайсе, остаются в каталоге и
+    попадают в отчет как удаленные из прайса.
+
+    Returns:
+        (обновленный каталог, таблица изменений)
+    """
+    new_df = new_df.assign(Артикул=_number_column(new_df['Артикул'])).drop_duplicates('Артикул', keep='last')
+    price_by_artikul = new_df.set_index('Артикул')
+    catalog_keys = _number_column(catalog_df['Артикул'])
+
+    merged = catalog_df.copy()
+    exists = catalog_keys.isin(price_by_artikul.index)
+    changed = pd.Series(False, index=merged.index)
+    for column in ['Цена', 'Категория: 1']:
+        new_values = catalog_keys[exists].map(price_by_artikul[column])
+        changed[exists] |= _text_column(merged.loc[exists, column]) != new_values
+        merged[column] = merged[column].astype(object)
+        merged.loc[exists, column] = new_values
+
+    added = new_df[~new_df['Артикул'].isin(catalog_keys)]
+    merged = pd.concat([merged, added], ignore_index=True)
+
+    changes = pd.concat([
+        added[['Артикул', 'Наименование']].assign(Изменение='добавлен'),
+        catalog_df.loc[changed, ['Артикул', 'Наименование']].assign(Изменение='обновлен'),
+        catalog_df.loc[~exists, ['Артикул', 'Наименование']].assign(Изменение='нет в прайсе')
+    ], ignore_index=True)
+
+    return merged, changes
+
+def main():
+    with stage('load') as record:
+        # Читаем price_new
+        price_df = read_table(find_stage('price_new'), sep=',')
+
+        # Читаем catalog6.csv
+        catalog_df = pd.read_csv('catalog6.csv', sep=';')
+        record['rows'] = len(price_df) + len(catalog_df)
+
+    # Создаем новые записи для catalog6
+    with stage('build', rows=len(price_df)):
+        new_df = build_catalog_records(price_df)
+
+    if not len(new_df):
+        print("Нет данных для добавления")
+        sys.exit(1)
+
+    # Обновляем существующие товары и добавляем только новые
+    with stage('merge', rows=len(new_df)):
+        updated_catalog, changes = merge_catalog(catalog_df, new_df)
+    output_path = stage_path('catalog6_new')
+    with stage('save', rows=len(updated_catalog)):
+        write_table(updated_catalog, output_path)
+        changes.to_csv('catalog6_changes.csv', sep=';', index=False, encoding='utf-8-sig')
+
+    counts = changes['Изменение'].value_counts()
+    print(f"Добавлено {counts.get('добавлен', 0)} новых товаров, "
+          f"обновлено {counts.get('обновлен', 0)}, "
+          f"нет в прайсе {counts.get('нет в прайсе', 0)}. "
+          f"Каталог сохранен в {output_path}, изменения в catalog6_changes.csv")
+
+if __name__ == "__main__":
+    with stage('update_catalog'):
+        main()